@@ -1,20 +1,35 @@
 import json
-import asyncio
 from pathlib import Path
 
 import streamlit as st
 
-from parser_core import run_project
+from dashboard import render_dashboard
+from exporters import EXPORT_FORMATS
+from job_manager import JobManager
 
 PROJECTS_FILE = "projects.json"
+JOB_POLL_INTERVAL = 2.0            # сек між оновленнями списку задач, поки вони йдуть
+JOB_STATUS_LABELS = {
+    "queued": "в черзі",
+    "running": "парситься",
+    "done": "готово",
+    "error": "помилка",
+    "interrupted": "перервано (запусти ще раз — продовжить з чекпойнту)",
+}
+
+
+@st.cache_data(show_spinner=False)
+def _read_projects(path: str, mtime: float):
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
 
 
 def load_projects():
+    """projects.json перечитується лише після зміни файлу (ключ кешу — mtime)."""
     path = Path(PROJECTS_FILE)
     if not path.exists():
         return {"projects": []}
-    with open(path, "r", encoding="utf-8") as f:
-        return json.load(f)
+    return _read_projects(str(path), path.stat().st_mtime)
 
 
 def save_projects(data):
@@ -39,6 +54,11 @@ def app():
 
     data = load_projects()
 
+    page = st.sidebar.radio("Розділ", ["Парсинг", "Дашборд"])
+    if page == "Дашборд":
+        render_dashboard(data)
+        return
+
     col1, col2 = st.columns([2, 1])
     with col1:
         st.subheader("Вибір або створення проєкту")
@@ -63,6 +83,8 @@ def app():
             "target_domains": [],
             "keywords": [],
             "max_positions": 30,
+            "fetch_mode": "paged",
+            "cache_ttl": 0,
             "history_file": "serp_history_new.json",
             "output_prefix": "serp_top_serper_NEW",
         }
@@ -139,6 +161,53 @@ def app():
         "Префікс для Excel-файлу",
         value=project.get("output_prefix", "serp_top_serper"),
     )
+    fetch_modes = ["paged", "deep"]
+    current_mode = project.get("fetch_mode", "paged")
+    project["fetch_mode"] = st.selectbox(
+        "Режим запитів",
+        fetch_modes,
+        index=fetch_modes.index(current_mode) if current_mode in fetch_modes else 0,
+        help=(
+            "paged — сторінки по 10 результатів (Top-40 = 4 запити на ключ).\n"
+            "deep — уся глибина одним запитом (num до 100), позиції ріжуться локально."
+        ),
+    )
+    domain_levels = ["host", "registrable"]
+    current_level = project.get("domain_level", "host")
+    project["domain_level"] = st.selectbox(
+        "Рівень доменів у звіті",
+        domain_levels,
+        index=domain_levels.index(current_level) if current_level in domain_levels else 0,
+        help=(
+            "host — кожен хост окремо (fr.example.co.uk, shop.example.co.uk).\n"
+            "registrable — групувати по зареєстрованому домену (example.co.uk)."
+        ),
+    )
+    project["export_formats"] = st.multiselect(
+        "Формати звіту",
+        list(EXPORT_FORMATS),
+        default=[f for f in project.get("export_formats", ["xlsx"]) if f in EXPORT_FORMATS],
+        help=(
+            "xlsx — Excel-звіт з усіма аркушами.\n"
+            "csv / jsonl / parquet — рядки видачі і зведення по доменах; parquet читається pandas.read_parquet."
+        ),
+    ) or ["xlsx"]
+    cols_cache = st.columns(2)
+    project["cache_ttl"] = int(
+        cols_cache[0].number_input(
+            "Кеш SERP, хв (0 — вимкнено)",
+            min_value=0,
+            max_value=24 * 60,
+            value=int(project.get("cache_ttl", 0)) // 60,
+            step=10,
+            help="Повторний запуск у межах цього часу бере видачу з кешу і не витрачає кредити.",
+        )
+    ) * 60
+    force_refresh = cols_cache[1].checkbox(
+        "Ігнорувати кеш (force refresh)",
+        value=False,
+        help="Запитати все заново навіть якщо в кеші є свіжі відповіді.",
+    )
 
     st.markdown("---")
     cols_buttons = st.columns(3)
@@ -192,20 +261,9 @@ def app():
                 "але збігів з таргетами не буде."
             )
 
-        progress_bar = st.progress(0)
-        status_text = st.empty()
-
-        def progress_callback(done, total, found):
-            frac = done / total if total else 0
-            progress_bar.progress(frac)
-            status_text.text(
-                f"[{project['name']}] Оброблено {done}/{total} ключових слів | "
-                f"знайдено позицій: {found}"
-            )
-
-        st.info("Парсинг запущено. Не закривай вкладку до завершення.")
-
         project_config = {
+            # решта налаштувань проєкту (pagination, rate_limit, ...) передається як є
+            **project,
             "name": project["name"],
             "location": project["location"],
             "gl": project["gl"],
@@ -214,26 +272,13 @@ def app():
             "target_domains": project["target_domains"],
             "keywords": project["keywords"],
             "max_positions": int(project["max_positions"]),
+            "fetch_mode": project["fetch_mode"],
             "history_file": project["history_file"],
             "output_prefix": project["output_prefix"],
         }
 
-        output_file = asyncio.run(run_project(project_config, progress_callback))
-
-        if Path(output_file).exists():
-            st.success(f"Готово! Звіт збережено: {output_file}")
-            with open(output_file, "rb") as f:
-                st.download_button(
-                    "⬇️ Завантажити Excel для цього проєкту",
-                    data=f,
-                    file_name=Path(output_file).name,
-                    mime=(
-                        "application/"
-                        "vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-                    ),
-                )
-        else:
-            st.error("Щось пішло не так — файл не знайдено.")
+        get_job_manager().submit([project_config], force_refresh=force_refresh)
+        st.info("Парсинг запущено у фоні — прогрес і звіт у розділі «Фонові задачі».")
 
     # =========================
     # МАСОВИЙ ПАРСИНГ ПРОЄКТІВ
@@ -274,39 +319,23 @@ def app():
             st.error("Вибери хоча б один проєкт для масового парсингу.")
             return
 
-        st.info(
-            "Масовий парсинг запущено. Не закривай вкладку, поки всі проєкти не завершаться."
-        )
-
         # Якщо задано pages_override, конвертуємо в Top N
         max_positions_override = None
         if pages_override > 0:
             max_positions_override = pages_override * 10
 
-        total_projects = len(selected_projects_multi)
-
-        for idx, proj_name in enumerate(selected_projects_multi, start=1):
+        # Спершу збираємо конфіги всіх проєктів — щоб спільні запити
+        # (той самий keyword у тому ж гео) робились один раз на весь запуск
+        mass_cfgs = []
+        for proj_name in selected_projects_multi:
             proj = get_project_by_name(data, proj_name)
             if proj is None:
                 st.warning(f"Пропускаю '{proj_name}' — не знайдено у projects.json.")
                 continue
 
-            st.markdown(
-                f"#### Проєкт {idx}/{total_projects}: **{proj['name']}**"
-            )
-            progress_bar = st.progress(0)
-            status_text = st.empty()
-
-            def progress_callback(done, total, found, _proj_name=proj["name"]):
-                frac = done / total if total else 0
-                progress_bar.progress(frac)
-                status_text.text(
-                    f"[{_proj_name}] Оброблено {done}/{total} ключових слів | "
-                    f"знайдено позицій: {found}"
-                )
-
             # Формуємо конфіг для запуску
             cfg = {
+                **proj,
                 "name": proj["name"],
                 "location": proj.get("location", "France"),
                 "gl": proj.get("gl", "fr"),
@@ -319,6 +348,7 @@ def app():
                     if max_positions_override is not None
                     else proj.get("max_positions", 30)
                 ),
+                "fetch_mode": proj.get("fetch_mode", "paged"),
                 "history_file": proj.get(
                     "history_file",
                     f"serp_history_{proj['name'].replace(' ', '_')}.json",
@@ -340,27 +370,62 @@ def app():
                     f"[{proj['name']}] Пропуск — немає ключових слів."
                 )
                 continue
+            mass_cfgs.append(cfg)
 
-            output_file = asyncio.run(run_project(cfg, progress_callback))
-
-            if Path(output_file).exists():
-                st.success(f"[{proj['name']}] Готово! Звіт: {output_file}")
-                with open(output_file, "rb") as f:
-                    st.download_button(
-                        f"⬇️ Завантажити Excel ({proj['name']})",
-                        data=f,
-                        file_name=Path(output_file).name,
-                        mime=(
-                            "application/"
-                            "vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-                        ),
-                        key=f"download_{proj['name']}_{idx}",
-                    )
-            else:
-                st.error(
-                    f"[{proj['name']}] Щось пішло не так — файл не знайдено."
+        if mass_cfgs:
+            # проєкти однієї задачі йдуть одночасно зі спільною дедуплікацією запитів
+            get_job_manager().submit(mass_cfgs, force_refresh=force_refresh)
+            st.info(
+                f"Запущено у фоні: {len(mass_cfgs)} проєктів — прогрес і звіти в розділі «Фонові задачі»."
+            )
+
+
+@st.cache_resource
+def get_job_manager() -> JobManager:
+    """Один менеджер на процес Streamlit — задачі переживають перезапуски сторінки."""
+    return JobManager()
+
+
+def render_jobs(manager: JobManager):
+    st.markdown("---")
+    cols = st.columns([4, 1])
+    cols[0].markdown("### Фонові задачі")
+    if cols[1].button("Очистити завершені"):
+        manager.clear_finished()
+
+    jobs = manager.jobs()
+    if not jobs:
+        st.caption("Задач ще не було.")
+        return
+
+    for job in jobs:
+        label = f"**{job['project']}** — {JOB_STATUS_LABELS.get(job['status'], job['status'])}"
+        if job["status"] in ("queued", "running"):
+            frac = job["done"] / job["total"] if job["total"] else 0
+            st.progress(min(frac, 1.0), text=(
+                f"{label} | Оброблено {job['done']}/{job['total']} ключових слів | "
+                f"знайдено позицій: {job['found']}"
+            ))
+        elif job["status"] == "done" and job["output"] and Path(job["output"]).exists():
+            output = Path(job["output"])
+            st.markdown(f"{label}: {output}")
+            with open(output, "rb") as f:
+                st.download_button(
+                    f"⬇️ Завантажити {output.suffix.lstrip('.')} ({job['project']})",
+                    data=f,
+                    file_name=output.name,
+                    key=f"download_{job['id']}",
                 )
+        elif job["status"] == "error":
+            st.error(f"[{job['project']}] Помилка: {job['error']}")
+        else:
+            st.markdown(label)
 
 
 if __name__ == "__main__":
     app()
+    manager = get_job_manager()
+    # поки є активні задачі — перечитується лише блок задач (фрагмент),
+    # а не вся сторінка з формою проєкту і дашбордом
+    poll = JOB_POLL_INTERVAL if manager.active() else None
+    st.fragment(render_jobs, run_every=poll)(manager)
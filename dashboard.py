@@ -0,0 +1,135 @@
+from pathlib import Path
+
+import pandas as pd
+import streamlit as st
+
+from history_store import HISTORY_DB, HistoryStore
+from parser_core import build_buckets, resolve_depth
+
+# =========================
+# Налаштування дашборду
+# =========================
+DASHBOARD_RUNS = (10, 30, 100, 300)  # варіанти глибини історії на графіках
+
+
+def history_mtime(db_path: str) -> float:
+    """Ключ кешу: графіки перераховуються лише після нового запису в історію."""
+    path = Path(db_path)
+    return path.stat().st_mtime if path.exists() else 0.0
+
+
+@st.cache_data(show_spinner=False)
+def load_run_stats(db_path: str, series: str, limit: int, mtime: float) -> list:
+    store = HistoryStore(db_path)
+    try:
+        return store.run_stats(series, limit)
+    finally:
+        store.close()
+
+
+@st.cache_data(show_spinner=False)
+def load_keyword_positions(db_path: str, series: str, keyword: str, limit: int, mtime: float) -> pd.DataFrame:
+    store = HistoryStore(db_path)
+    try:
+        rows = store.keyword_positions(series, keyword, limit)
+    finally:
+        store.close()
+    frame = pd.DataFrame(rows, columns=["Date", "Domain", "Position"])
+    return frame.pivot_table(index="Date", columns="Domain", values="Position", aggfunc="min")
+
+
+def visibility_frame(stats: list) -> pd.DataFrame:
+    """Кількість позицій кожного таргетного домену по запусках."""
+    return pd.DataFrame(
+        [{domain: sum(hist.values()) for domain, hist in run["targets"].items()} for run in stats],
+        index=[run["timestamp"] for run in stats],
+    ).fillna(0).astype(int)
+
+
+def buckets_frame(stats: list, bucket_ranges, bucket_labels) -> pd.DataFrame:
+    """Розподіл таргетних позицій по бакетах по запусках."""
+    rows = []
+    for run in stats:
+        counts = dict.fromkeys(bucket_labels, 0)
+        for hist in run["targets"].values():
+            for pos, n in hist.items():
+                pos = int(pos)
+                for (start, end), label in zip(bucket_ranges, bucket_labels):
+                    if start <= pos <= end:
+                        counts[label] += n
+                        break
+        rows.append(counts)
+    return pd.DataFrame(rows, index=[run["timestamp"] for run in stats], columns=bucket_labels)
+
+
+def summary_frame(stats: list) -> pd.DataFrame:
+    """Середня позиція і кількість таргетних позицій по запусках."""
+    rows = []
+    for run in stats:
+        total = weighted = 0
+        for hist in run["targets"].values():
+            for pos, n in hist.items():
+                total += n
+                weighted += int(pos) * n
+        rows.append({"Total Found": total, "Avg Pos": round(weighted / total, 1) if total else None})
+    return pd.DataFrame(rows, index=[run["timestamp"] for run in stats])
+
+
+def render_dashboard(data: dict):
+    st.subheader("Дашборд історії")
+
+    projects = data.get("projects", [])
+    if not projects:
+        st.info("Ще немає збережених проєктів.")
+        return
+
+    cols = st.columns([3, 1])
+    name = cols[0].selectbox("Проєкт", [p["name"] for p in projects])
+    limit = cols[1].selectbox("Запусків", DASHBOARD_RUNS, index=1)
+    project = next(p for p in projects if p["name"] == name)
+
+    series = project.get("history_file") or f"serp_history_{name.replace(' ', '_')}.json"
+    db_path = project.get("history_db") or HISTORY_DB
+    mtime = history_mtime(db_path)
+
+    stats = load_run_stats(db_path, series, limit, mtime)
+    if not stats:
+        st.info("Для цього проєкту ще немає історії запусків.")
+        return
+
+    _, max_positions = resolve_depth(project)
+    bucket_ranges, bucket_labels = build_buckets(max_positions)
+
+    summary = summary_frame(stats)
+    last = summary.iloc[-1]
+    metrics = st.columns(3)
+    metrics[0].metric("Запусків", len(stats))
+    metrics[1].metric(
+        "Таргетних позицій",
+        int(last["Total Found"]),
+        delta=int(last["Total Found"] - summary.iloc[-2]["Total Found"]) if len(summary) > 1 else None,
+    )
+    metrics[2].metric("Середня позиція", last["Avg Pos"] if pd.notna(last["Avg Pos"]) else "—")
+
+    tab_vis, tab_buckets, tab_kw = st.tabs(["Видимість", "Бакети", "Позиції по keyword"])
+
+    with tab_vis:
+        st.caption("Кількість позицій у видачі для кожного таргетного домену")
+        st.line_chart(visibility_frame(stats))
+
+    with tab_buckets:
+        st.caption("Таргетні позиції за бакетами")
+        st.bar_chart(buckets_frame(stats, bucket_ranges, bucket_labels))
+
+    with tab_kw:
+        keywords = [k.strip() for k in project.get("keywords", []) if k.strip()]
+        if not keywords:
+            st.info("У проєкті немає ключових слів.")
+        else:
+            keyword = st.selectbox("Ключове слово", keywords)
+            positions = load_keyword_positions(db_path, series, keyword, limit, mtime)
+            if positions.empty:
+                st.info("Таргетні домени по цьому ключовому слову ще не знаходились.")
+            else:
+                st.caption("Найкраща позиція таргетного домену (менше — краще)")
+                st.line_chart(positions)
@@ -0,0 +1,138 @@
+import csv
+import json
+from pathlib import Path
+
+# =========================
+# Експорт результатів (крім Excel)
+# =========================
+EXPORT_FORMATS = ("xlsx", "csv", "jsonl", "parquet")
+PARQUET_BATCH_ROWS = 20000         # рядків на row group; стільки ж максимум у пам'яті
+PARQUET_COMPRESSION = "zstd"
+SUMMARY_SUFFIX = ".summary.json"   # зведення запуску поруч зі звітом (для дельт бота)
+
+# колонки таблиці results (рядок видачі) у файлах експорту
+RESULT_COLUMNS = (
+    "Project", "Keyword", "Position", "Domain", "Title", "Snippet",
+    "URL", "Is_Target", "Target", "Bucket",
+)
+
+
+def result_record(project: str, row: dict) -> dict:
+    return {
+        "Project": project,
+        "Keyword": row["Keyword"],
+        "Position": row["Position"],
+        "Domain": row["Domain"],
+        "Title": row["Title"],
+        "Snippet": row["Snippet"],
+        "URL": row["URL"],
+        "Is_Target": bool(row["Is_Target"]),
+        "Target": row.get("Target") or "",
+        "Bucket": row["Bucket"],
+    }
+
+
+def export_csv(path: str, columns, records) -> str:
+    with open(path, "w", encoding="utf-8-sig", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=list(columns))
+        writer.writeheader()
+        for record in records:
+            writer.writerow(record)
+    return path
+
+
+def export_jsonl(path: str, columns, records) -> str:
+    with open(path, "w", encoding="utf-8") as f:
+        for record in records:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+    return path
+
+
+def export_parquet(path: str, columns, records) -> str:
+    """
+    Колонковий стиснений файл (pd.read_parquet(path) читає напряму).
+    Пишеться row group-ами по PARQUET_BATCH_ROWS, тож весь набір
+    у пам'ять не збирається.
+    """
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise RuntimeError("для експорту в Parquet потрібен pyarrow (pip install pyarrow)")
+
+    columns = list(columns)
+    writer = None
+    batch = []
+
+    def flush():
+        nonlocal writer
+        table = pa.Table.from_pylist(batch)
+        if writer is None:
+            writer = pq.ParquetWriter(path, table.schema, compression=PARQUET_COMPRESSION)
+        else:
+            table = table.cast(writer.schema)
+        writer.write_table(table)
+        batch.clear()
+
+    try:
+        for record in records:
+            batch.append({c: record.get(c) for c in columns})
+            if len(batch) >= PARQUET_BATCH_ROWS:
+                flush()
+        if batch or writer is None:
+            if not batch:
+                # порожній запуск — файл з одними колонками
+                pq.write_table(pa.table({c: pa.array([], pa.string()) for c in columns}), path)
+                return path
+            flush()
+    finally:
+        if writer is not None:
+            writer.close()
+    return path
+
+
+EXPORTERS = {
+    "csv": (".csv", export_csv),
+    "jsonl": (".jsonl", export_jsonl),
+    "parquet": (".parquet", export_parquet),
+}
+
+
+def export_tables(formats, base_path: str, tables: dict) -> list:
+    """
+    Пише кожну таблицю в кожному з форматів: <base_path>.<table>.<ext>.
+    tables — {назва: (колонки, функція, що повертає новий ітератор записів)}.
+    Невідомі формати та "xlsx" (його пише write_report) пропускаються.
+    Помилка одного формату не зупиняє інші. Повертає шляхи записаних файлів.
+    """
+    paths = []
+    Path(base_path).parent.mkdir(parents=True, exist_ok=True)
+    for fmt in formats:
+        if fmt not in EXPORTERS:
+            if fmt != "xlsx":
+                print(f"Невідомий формат експорту: {fmt}")
+            continue
+        ext, exporter = EXPORTERS[fmt]
+        for name, (columns, records) in tables.items():
+            path = f"{base_path}.{name}{ext}"
+            try:
+                paths.append(exporter(path, columns, records()))
+            except Exception as e:
+                print(f"Помилка експорту {path}: {e}")
+    return paths
+
+
+# =========================
+# Зведення запуску (.summary.json)
+# =========================
+def write_summary(base_path: str, summary: dict) -> str:
+    path = base_path + SUMMARY_SUFFIX
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(summary, f, ensure_ascii=False)
+    return path
+
+
+def read_summary(path) -> dict:
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
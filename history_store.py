@@ -0,0 +1,317 @@
+import glob
+import json
+import sqlite3
+import sys
+import time
+from pathlib import Path
+
+# =========================
+# Налаштування історії
+# =========================
+HISTORY_DB = "serp_history.sqlite"
+REPORT_HISTORY_RUNS = 10           # скільки попередніх запусків показує звіт (зберігаються всі)
+HISTORY_SHEET_RUNS = 5             # за скільки останніх запусків аркуш History показує зміни
+
+RESULT_FIELDS = ("Keyword", "Position", "Domain", "Title", "Snippet", "URL", "Is_Target")
+CHANGE_FIELDS = ("Keyword", "Domain", "Change", "Prev", "Position")
+
+
+class HistoryStore:
+    """
+    Історія запусків у SQLite замість JSON, що переписувався цілком:
+      runs    — один рядок на запуск (серія = history_file проєкту, час);
+      results — рядки видачі запуску;
+      changes — зміни таргетних пар відносно попереднього запуску
+                (new / lost / up / down), з них будується аркуш History;
+      run_stats — зведення запуску для дашборду: кількість рядків і
+                  гістограма позицій кожного таргетного домену.
+    Новий запуск — лише INSERT його рядків, тож ціна O(нових рядків),
+    а обмеження на кількість запусків немає. Запуск унікальний за
+    (серія, час): повторний add_run того самого запуску (перезапуск
+    після збою звіту) замінює його, а не дублює позиції. Індекси:
+    results(keyword, domain, run_id) для динаміки пари і
+    results(run_id, is_target) для вибірки запуску.
+
+    Серія ідентифікується рядком history_file з конфігу проєкту — старий
+    JSON з тим самим ім'ям імпортується в неї автоматично при першому
+    зверненні (ensure_imported), або вручну: python history_store.py import.
+    """
+
+    def __init__(self, path: str = HISTORY_DB):
+        self.path = path
+        self.conn = sqlite3.connect(path, timeout=30)
+        self.conn.executescript(
+            "CREATE TABLE IF NOT EXISTS runs ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+            " series TEXT NOT NULL,"
+            " project TEXT NOT NULL DEFAULT '',"
+            " timestamp TEXT NOT NULL,"
+            " created REAL NOT NULL);"
+            "CREATE INDEX IF NOT EXISTS idx_runs_series ON runs(series, timestamp);"
+            "CREATE TABLE IF NOT EXISTS results ("
+            " run_id INTEGER NOT NULL REFERENCES runs(id) ON DELETE CASCADE,"
+            " keyword TEXT NOT NULL,"
+            " position INTEGER NOT NULL,"
+            " domain TEXT NOT NULL,"
+            " title TEXT,"
+            " snippet TEXT,"
+            " url TEXT,"
+            " is_target INTEGER NOT NULL);"
+            "CREATE INDEX IF NOT EXISTS idx_results_kw_domain ON results(keyword, domain, run_id);"
+            "CREATE INDEX IF NOT EXISTS idx_results_run ON results(run_id, is_target);"
+            "CREATE TABLE IF NOT EXISTS changes ("
+            " run_id INTEGER NOT NULL REFERENCES runs(id) ON DELETE CASCADE,"
+            " keyword TEXT NOT NULL,"
+            " domain TEXT NOT NULL,"
+            " change TEXT NOT NULL,"
+            " prev_position INTEGER,"
+            " position INTEGER);"
+            "CREATE INDEX IF NOT EXISTS idx_changes_run ON changes(run_id);"
+            "CREATE TABLE IF NOT EXISTS run_stats ("
+            " run_id INTEGER PRIMARY KEY REFERENCES runs(id) ON DELETE CASCADE,"
+            " found INTEGER NOT NULL,"
+            " targets TEXT NOT NULL);"
+            "CREATE TABLE IF NOT EXISTS imports ("
+            " source TEXT PRIMARY KEY,"
+            " imported REAL NOT NULL);"
+        )
+        if not self.conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = 'idx_runs_series_ts'"
+        ).fetchone():
+            # бази, де запуск уже встиг записатись двічі, — лишаємо новіший запис
+            with self.conn:
+                self._delete_runs(
+                    [
+                        run_id
+                        for (run_id,) in self.conn.execute(
+                            "SELECT id FROM runs WHERE id NOT IN (SELECT MAX(id) FROM runs GROUP BY series, timestamp)"
+                        ).fetchall()
+                    ]
+                )
+                self.conn.execute("CREATE UNIQUE INDEX idx_runs_series_ts ON runs(series, timestamp)")
+        self.conn.commit()
+
+    def _delete_runs(self, run_ids: list):
+        # каскад FOREIGN KEY у SQLite вимкнено за замовчуванням — чистимо таблиці явно
+        for table, column in (("results", "run_id"), ("changes", "run_id"), ("run_stats", "run_id"), ("runs", "id")):
+            self.conn.executemany(f"DELETE FROM {table} WHERE {column} = ?", [(run_id,) for run_id in run_ids])
+
+    def add_run(self, series: str, timestamp: str, rows, project: str = "", changes=()) -> int:
+        """
+        Записує запуск одним транзакційним INSERT-ом; rows — будь-який
+        ітерабельний (генератор з журналу теж), у пам'ять не збирається.
+        changes — [{"Keyword", "Domain", "Change", "Prev", "Position"}, ...].
+        Зведення для дашборду (run_stats) рахується тим самим проходом.
+        Запуск серії з тим самим timestamp уже є — замінюється цілком.
+        """
+        found = 0
+        targets = {}
+
+        def counted(rows):
+            nonlocal found
+            for r in rows:
+                found += 1
+                if r.get("Is_Target"):
+                    hist = targets.setdefault(r["Domain"], {})
+                    pos = str(int(r["Position"]))
+                    hist[pos] = hist.get(pos, 0) + 1
+                yield r
+
+        with self.conn:
+            self._delete_runs(
+                [
+                    run_id
+                    for (run_id,) in self.conn.execute(
+                        "SELECT id FROM runs WHERE series = ? AND timestamp = ?", (series, timestamp)
+                    ).fetchall()
+                ]
+            )
+            cur = self.conn.execute(
+                "INSERT INTO runs (series, project, timestamp, created) VALUES (?, ?, ?, ?)",
+                (series, project, timestamp, time.time()),
+            )
+            run_id = cur.lastrowid
+            self.conn.executemany(
+                "INSERT INTO results (run_id, keyword, position, domain, title, snippet, url, is_target) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    (
+                        run_id,
+                        r["Keyword"],
+                        int(r["Position"]),
+                        r["Domain"],
+                        r.get("Title", ""),
+                        r.get("Snippet", ""),
+                        r.get("URL", ""),
+                        1 if r.get("Is_Target") else 0,
+                    )
+                    for r in counted(rows)
+                ),
+            )
+            self.conn.execute(
+                "INSERT INTO run_stats (run_id, found, targets) VALUES (?, ?, ?)",
+                (run_id, found, json.dumps(targets, ensure_ascii=False)),
+            )
+            self.conn.executemany(
+                "INSERT INTO changes (run_id, keyword, domain, change, prev_position, position) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                ((run_id, *(c[f] for f in CHANGE_FIELDS)) for c in changes),
+            )
+        return run_id
+
+    def runs(self, series: str, limit: int = None) -> list:
+        """[(run_id, timestamp), ...] серії від старших до новіших; limit — останні N."""
+        sql = "SELECT id, timestamp FROM runs WHERE series = ? ORDER BY timestamp DESC, id DESC"
+        params = [series]
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(int(limit))
+        return list(reversed(self.conn.execute(sql, params).fetchall()))
+
+    def load(self, series: str, limit: int = REPORT_HISTORY_RUNS, targets_only: bool = True) -> list:
+        """
+        Останні limit запусків серії у форматі колишнього JSON:
+          [{"timestamp": ..., "results": [{"Keyword", "Position", "Domain", ...}]}, ...]
+        Звіту потрібні лише таргетні рядки — їх і читаємо (targets_only).
+        """
+        history = []
+        for run_id, timestamp in self.runs(series, limit):
+            sql = (
+                "SELECT keyword, position, domain, title, snippet, url, is_target "
+                "FROM results WHERE run_id = ?"
+            )
+            if targets_only:
+                sql += " AND is_target = 1"
+            results = [
+                dict(zip(RESULT_FIELDS, (kw, pos, dom, title, snip, url, bool(tgt))))
+                for kw, pos, dom, title, snip, url, tgt in self.conn.execute(sql + " ORDER BY rowid", (run_id,))
+            ]
+            history.append({"timestamp": timestamp, "results": results})
+        return history
+
+    def changes(self, series: str, limit: int = HISTORY_SHEET_RUNS) -> list:
+        """
+        Зміни останніх limit запусків серії, від новіших до старших:
+          [{"timestamp", "Keyword", "Domain", "Change", "Prev", "Position"}, ...]
+        """
+        run_ids = [run_id for run_id, _ in reversed(self.runs(series, limit))]
+        out = []
+        for run_id in run_ids:
+            for row in self.conn.execute(
+                "SELECT r.timestamp, c.keyword, c.domain, c.change, c.prev_position, c.position "
+                "FROM changes c JOIN runs r ON r.id = c.run_id WHERE c.run_id = ? ORDER BY c.rowid",
+                (run_id,),
+            ):
+                out.append(dict(zip(("timestamp",) + CHANGE_FIELDS, row)))
+        return out
+
+    def run_stats(self, series: str, limit: int = None) -> list:
+        """
+        Зведення запусків серії від старших до новіших:
+          [{"timestamp", "found", "targets": {domain: {позиція: к-сть}}}, ...]
+        Запуски, записані до появи run_stats, дораховуються з results один раз.
+        """
+        out = []
+        for run_id, timestamp in self.runs(series, limit):
+            row = self.conn.execute("SELECT found, targets FROM run_stats WHERE run_id = ?", (run_id,)).fetchone()
+            if row is None:
+                row = self._backfill_stats(run_id)
+            out.append({"timestamp": timestamp, "found": row[0], "targets": json.loads(row[1])})
+        return out
+
+    def _backfill_stats(self, run_id: int):
+        found = self.conn.execute("SELECT COUNT(*) FROM results WHERE run_id = ?", (run_id,)).fetchone()[0]
+        targets = {}
+        for domain, pos, n in self.conn.execute(
+            "SELECT domain, position, COUNT(*) FROM results WHERE run_id = ? AND is_target = 1 "
+            "GROUP BY domain, position",
+            (run_id,),
+        ):
+            targets.setdefault(domain, {})[str(pos)] = n
+        raw = json.dumps(targets, ensure_ascii=False)
+        with self.conn:
+            self.conn.execute("INSERT OR REPLACE INTO run_stats (run_id, found, targets) VALUES (?, ?, ?)",
+                              (run_id, found, raw))
+        return found, raw
+
+    def keyword_positions(self, series: str, keyword: str, limit: int = None) -> list:
+        """
+        Найкраща позиція кожного таргетного домену по keyword у кожному
+        запуску серії: [(timestamp, domain, position), ...] від старших до новіших.
+        """
+        sql = (
+            "SELECT r.timestamp, s.domain, MIN(s.position) FROM results s JOIN runs r ON r.id = s.run_id "
+            "WHERE s.keyword = ? AND s.is_target = 1 AND r.series = ?"
+        )
+        params = [keyword, series]
+        if limit is not None:
+            runs = self.runs(series, limit)
+            if not runs:
+                return []
+            sql += " AND (r.timestamp > ? OR (r.timestamp = ? AND r.id >= ?))"
+            params += [runs[0][1], runs[0][1], runs[0][0]]
+        return self.conn.execute(sql + " GROUP BY r.id, s.domain ORDER BY r.timestamp, r.id", params).fetchall()
+
+    def import_json(self, json_path: str, series: str = None, project: str = "") -> int:
+        """
+        Одноразовий імпорт старого serp_history*.json у серію (за замовчуванням —
+        сам шлях, як history_file у конфігу). Повторний виклик нічого не дублює.
+        Повертає кількість імпортованих запусків.
+        """
+        series = series or str(json_path)
+        source = str(Path(json_path).resolve())
+        if self.conn.execute("SELECT 1 FROM imports WHERE source = ?", (source,)).fetchone():
+            return 0
+        try:
+            with open(json_path, "r", encoding="utf-8") as f:
+                entries = json.load(f)
+        except FileNotFoundError:
+            return 0
+        known = {ts for _, ts in self.runs(series)}
+        imported = 0
+        for entry in entries:
+            ts = entry.get("timestamp")
+            if not ts or ts in known:
+                continue
+            self.add_run(series, ts, entry.get("results", []), project=project)
+            imported += 1
+        with self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO imports (source, imported) VALUES (?, ?)", (source, time.time())
+            )
+        return imported
+
+    def ensure_imported(self, history_file: str, project: str = ""):
+        """Якщо для history_file ще є лише старий JSON — переносимо його в базу."""
+        if Path(history_file).exists():
+            n = self.import_json(history_file, history_file, project)
+            if n:
+                print(f"Історію {history_file} імпортовано в {self.path} ({n} запусків)")
+
+    def close(self):
+        try:
+            self.conn.close()
+        except Exception:
+            pass
+
+
+def import_history_files(pattern: str = "serp_history*.json", db_path: str = HISTORY_DB) -> int:
+    """Імпортує всі JSON-історії за шаблоном; серія кожної — її шлях."""
+    store = HistoryStore(db_path)
+    total = 0
+    try:
+        for path in sorted(glob.glob(pattern)):
+            n = store.import_json(path)
+            print(f"{path}: імпортовано запусків — {n}")
+            total += n
+    finally:
+        store.close()
+    return total
+
+
+if __name__ == "__main__":
+    # python history_store.py import ["serp_history*.json"]
+    if len(sys.argv) >= 2 and sys.argv[1] == "import":
+        import_history_files(*(sys.argv[2:3] or ["serp_history*.json"]))
+    else:
+        print("Використання: python history_store.py import [шаблон]")
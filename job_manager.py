@@ -0,0 +1,153 @@
+import asyncio
+import contextlib
+import sqlite3
+import threading
+import time
+import uuid
+
+from parser_core import SerpRuntime, SharedSerpStore, run_project
+
+# =========================
+# Налаштування фонових задач
+# =========================
+JOBS_DB = "jobs.sqlite"
+JOB_WORKERS = 3                    # скільки проєктів парситься одночасно (на всі задачі разом)
+JOB_PROGRESS_INTERVAL = 1.0        # сек між записами прогресу в таблицю
+JOB_HISTORY_LIMIT = 50             # скільки останніх задач показувати
+ACTIVE_STATUSES = ("queued", "running")
+
+
+class JobManager:
+    """
+    Фонові запуски проєктів для Streamlit: submit() повертає id одразу,
+    а парсинг іде в окремому потоці зі своїм циклом подій, тож
+    не залежить від вкладки браузера і перезапусків сторінки.
+
+    Стан кожного проєкту — рядок таблиці jobs (SQLite): статус
+    queued / running / done / error / interrupted, прогрес з
+    progress_callback run_project, шлях до звіту або текст помилки.
+    UI лише читає таблицю (jobs()).
+
+    Проєкти одного submit() йдуть через спільний SerpRuntime і
+    SharedSerpStore (як run_projects), а одночасно виконується не більше
+    max_workers проєктів з усіх задач. Задачі, що не доробились через
+    перезапуск процесу, позначаються interrupted — повторний запуск
+    продовжить їх з чекпойнту.
+    """
+
+    def __init__(self, db_path: str = JOBS_DB, max_workers: int = JOB_WORKERS):
+        self.db_path = db_path
+        self.max_workers = max_workers
+        self.slots = threading.Semaphore(max_workers)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                " id TEXT PRIMARY KEY,"
+                " batch TEXT NOT NULL,"
+                " project TEXT NOT NULL,"
+                " status TEXT NOT NULL,"
+                " done INTEGER NOT NULL DEFAULT 0,"
+                " total INTEGER NOT NULL DEFAULT 0,"
+                " found INTEGER NOT NULL DEFAULT 0,"
+                " output TEXT,"
+                " error TEXT,"
+                " created REAL NOT NULL,"
+                " started REAL,"
+                " finished REAL);"
+                "CREATE INDEX IF NOT EXISTS idx_jobs_created ON jobs(created);"
+            )
+            # задачі попереднього процесу вже ніхто не виконує
+            conn.execute(
+                "UPDATE jobs SET status = 'interrupted', finished = ? WHERE status IN (?, ?)",
+                (time.time(), *ACTIVE_STATUSES),
+            )
+
+    @contextlib.contextmanager
+    def _connect(self):
+        # окреме з'єднання на виклик — таблицю пишуть потоки задач і читає UI
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def _update(self, job_id: str, **fields):
+        sets = ", ".join(f"{k} = ?" for k in fields)
+        with self._connect() as conn:
+            conn.execute(f"UPDATE jobs SET {sets} WHERE id = ?", (*fields.values(), job_id))
+
+    def submit(self, project_configs: list, force_refresh: bool = False) -> list:
+        """Ставить проєкти в чергу і одразу повертає id їхніх задач."""
+        batch = uuid.uuid4().hex
+        now = time.time()
+        jobs = []
+        with self._connect() as conn:
+            for cfg in project_configs:
+                job_id = uuid.uuid4().hex
+                total = len([k for k in cfg.get("keywords", []) if k.strip()])
+                conn.execute(
+                    "INSERT INTO jobs (id, batch, project, status, total, created) VALUES (?, ?, ?, 'queued', ?, ?)",
+                    (job_id, batch, cfg["name"], total, now),
+                )
+                jobs.append((job_id, cfg))
+        threading.Thread(
+            target=asyncio.run, args=(self._run_batch(jobs, force_refresh),), name=f"jobs-{batch[:8]}", daemon=True
+        ).start()
+        return [job_id for job_id, _ in jobs]
+
+    async def _run_batch(self, jobs: list, force_refresh: bool):
+        configs = [cfg for _, cfg in jobs]
+        try:
+            store = SharedSerpStore.for_projects(configs)
+            async with SerpRuntime.for_projects(configs, shared_store=store) as runtime:
+                await asyncio.gather(*(self._run_job(job_id, cfg, force_refresh, runtime) for job_id, cfg in jobs))
+        except Exception as e:
+            # помилка спільних ресурсів — задачі, що не встигли завершитись
+            for job_id, _ in jobs:
+                with self._connect() as conn:
+                    conn.execute(
+                        "UPDATE jobs SET status = 'error', error = ?, finished = ? WHERE id = ? AND status IN (?, ?)",
+                        (str(e), time.time(), job_id, *ACTIVE_STATUSES),
+                    )
+
+    async def _run_job(self, job_id: str, cfg: dict, force_refresh: bool, runtime: SerpRuntime):
+        # слот з усіх задач — чекаємо в пулі потоків, щоб не блокувати цикл
+        await asyncio.to_thread(self.slots.acquire)
+        try:
+            self._update(job_id, status="running", started=time.time())
+            last_write = 0.0
+
+            def progress_callback(done, total, found):
+                nonlocal last_write
+                now = time.monotonic()
+                if now - last_write >= JOB_PROGRESS_INTERVAL or done == total:
+                    last_write = now
+                    self._update(job_id, done=done, total=total, found=found)
+
+            output = await run_project(cfg, progress_callback, force_refresh=force_refresh, runtime=runtime)
+            self._update(job_id, status="done", output=output, finished=time.time())
+        except Exception as e:
+            self._update(job_id, status="error", error=str(e), finished=time.time())
+        finally:
+            self.slots.release()
+
+    def jobs(self, limit: int = JOB_HISTORY_LIMIT) -> list:
+        """Останні задачі, новіші першими: [{"id", "project", "status", "done", "total", ...}]."""
+        with self._connect() as conn:
+            conn.row_factory = sqlite3.Row
+            rows = conn.execute(
+                "SELECT * FROM jobs ORDER BY created DESC, rowid DESC LIMIT ?", (int(limit),)
+            ).fetchall()
+        return [dict(r) for r in rows]
+
+    def active(self) -> bool:
+        with self._connect() as conn:
+            return conn.execute(
+                "SELECT 1 FROM jobs WHERE status IN (?, ?) LIMIT 1", ACTIVE_STATUSES
+            ).fetchone() is not None
+
+    def clear_finished(self):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM jobs WHERE status NOT IN (?, ?)", ACTIVE_STATUSES)
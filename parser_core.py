@@ -1,43 +1,71 @@
 import aiohttp
 import asyncio
+import contextlib
+from copy import copy
 import json
 from urllib.parse import urlparse
 from openpyxl import Workbook
-from openpyxl.styles import Font, Alignment, PatternFill
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import DEFAULT_FONT, Font, Alignment, NamedStyle, PatternFill
+from openpyxl.utils import get_column_letter
 import random
 import datetime
-from collections import defaultdict
+import hashlib
+import time
+from collections import Counter, defaultdict, deque
+from functools import lru_cache
 from pathlib import Path
 import math
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from public_suffix import registrable_domain
+from report_catalog import ReportCatalog
+from exporters import RESULT_COLUMNS, export_tables, result_record, write_summary
+from history_store import HistoryStore, HISTORY_DB, HISTORY_SHEET_RUNS
+from serp_cache import SerpCache, normalize_request
+from run_journal import RunJournal
 
 # =========================
-# Глобальні змінні (налаштовуються з проекту)
+# Константи (налаштування конкретного запуску — у RunContext)
 # =========================
-LOCATION = "France"
-GL = "fr"
-HL = "fr"
 BASE_URL = "https://google.serper.dev/search"
-
-TARGET_DOMAINS = set()
-
-RESULTS_PER_PAGE = 10              # скільки результатів просимо за запит
-MAX_CONCURRENT_REQUESTS = 3        # як ти попросив
-
-PAGES = 3                          # реальна кількість сторінок (рахується з MAX_POSITIONS)
-MAX_POSITIONS = 30                 # Top N
-
-HISTORY_FILE = "serp_history.json"
-OUTPUT_FILE = "serp_output.xlsx"
-
-# Динамічні бакети, залежать від MAX_POSITIONS
-BUCKET_RANGES = []  # список (start, end)
-BUCKET_LABELS = []  # список "start-end"
+ACCOUNT_URL = "https://google.serper.dev/account"
+
+RESULTS_PER_PAGE = 10              # скільки результатів просимо за запит (режим "paged")
+DEEP_RESULTS_PER_REQUEST = 100     # максимум num за один запит (режим "deep")
+SERPER_NUM_OPTIONS = (10, 20, 30, 40, 50, 100)  # значення num, які приймає Serper
+MAX_CONCURRENT_REQUESTS = 3        # стартова паралельність (далі керує AdaptiveLimiter)
+MIN_CONCURRENT_REQUESTS = 1
+MAX_CONCURRENT_REQUESTS_LIMIT = 12 # стеля, до якої AIMD може розігнатися
+LATENCY_TARGET = 3.0               # сек; повільніше — паралельність не росте
+
+KEY_REQUESTS_PER_SECOND = 5.0      # token bucket на кожен API-ключ
+KEY_BURST = 5
+KEY_COOLDOWN_RATE_LIMIT = 5.0      # сек паузи ключа після 429 (далі — експоненційно)
+KEY_COOLDOWN_EXHAUSTED = 6 * 3600  # сек паузи ключа без кредитів / заблокованого
+KEY_MAX_WAIT = 300.0               # якщо всі ключі на паузі довше — здаємось
+KEY_STATE_FILE = "api_keys_state.json"
+KEY_BALANCE_TTL = 60.0             # сек; баланс ключа, щойно перевірений іншим проєктом, не перепитуємо
+PIPELINE_WORKERS = 6               # скільки job-ів keyword×page обробляється паралельно
+REQUESTS_PER_SECOND = 5.0          # дефолтний темп запитів (rate_limit у проєкті)
+
+LAZY_FULL_PAGE_RATIO = 0.7         # сторінка "повна", якщо organic >= 70% num (Google часто дає 8-9 з 10)
+BATCH_SIZE = 0                     # >1 — кількість запитів в одному POST (batch_size у проєкті)
+BATCH_MAX_DELAY = 0.05             # сек очікування, поки батч наповнюється
+STREAM_QUEUE_SIZE = 16             # keywords у черзі stream_keywords; далі воркери чекають на споживача
+DOMAIN_KEYWORDS_SAMPLE = 20        # keywords не-таргетного домену в колонці Keywords (далі — "+N")
+REPORT_WORKERS = min(4, os.cpu_count() or 1)  # процесів для звітів; 0 — звіт у потоці цього процесу
 
 
 # =========================
 # ПІДТРИМКА СУБДОМЕНІВ
 # =========================
+@lru_cache(maxsize=65536)
 def get_full_domain(url: str) -> str:
+    # ті самі URL повторюються між keywords і запусками — кешуємо
     try:
         netloc = urlparse(url).netloc.lower()
         if netloc.startswith("www."):
@@ -49,11 +77,35 @@ def get_full_domain(url: str) -> str:
         return ""
 
 
-def is_target_domain(full_domain: str) -> bool:
-    for target in TARGET_DOMAINS:
-        if full_domain == target or full_domain.endswith("." + target):
-            return True
-    return False
+class TargetMatcher:
+    """
+    Таргет-домени як множина: хост підходить, якщо він сам або будь-який
+    його батьківський домен є в множині (a.b.example.fr -> b.example.fr ->
+    example.fr -> fr). Це O(кількості міток) замість перебору всіх таргетів.
+    match() повертає сам таргет, тож зведення по таргетах безкоштовні.
+    """
+
+    def __init__(self, target_domains):
+        self.targets = {t.strip().lower() for t in target_domains if t and t.strip()}
+
+    def match(self, full_domain: str):
+        """Таргет, під який підпадає хост (найдовший), або None."""
+        host = full_domain
+        while host:
+            if host in self.targets:
+                return host
+            dot = host.find(".")
+            if dot < 0:
+                return None
+            host = host[dot + 1:]
+        return None
+
+    def __len__(self):
+        return len(self.targets)
+
+
+def is_target_domain(ctx: "RunContext", full_domain: str) -> bool:
+    return ctx.targets.match(full_domain) is not None
 
 
 # =========================
@@ -61,49 +113,135 @@ def is_target_domain(full_domain: str) -> bool:
 # =========================
 def build_buckets(max_positions: int):
     """
-    Створює:
-      BUCKET_RANGES: список (start, end)
-      BUCKET_LABELS: список "start-end"
+    Повертає (bucket_ranges, bucket_labels):
+      bucket_ranges: список (start, end)
+      bucket_labels: список "start-end"
 
     Логіка:
       1-3, 4-10, 11-20, 21-30, далі 31-40, 41-50, ... до max_positions
     """
-    global BUCKET_RANGES, BUCKET_LABELS
-    BUCKET_RANGES = []
-    BUCKET_LABELS = []
+    bucket_ranges = []
 
     # Базові бакети
     if max_positions >= 1:
-        BUCKET_RANGES.append((1, min(3, max_positions)))
+        bucket_ranges.append((1, min(3, max_positions)))
     if max_positions >= 4:
-        BUCKET_RANGES.append((4, min(10, max_positions)))
+        bucket_ranges.append((4, min(10, max_positions)))
     if max_positions >= 11:
-        BUCKET_RANGES.append((11, min(20, max_positions)))
+        bucket_ranges.append((11, min(20, max_positions)))
     if max_positions >= 21:
-        BUCKET_RANGES.append((21, min(30, max_positions)))
+        bucket_ranges.append((21, min(30, max_positions)))
 
     # Далі — кроками по 10: 31-40, 41-50, ...
     start = 31
     while start <= max_positions:
         end = min(start + 9, max_positions)
-        BUCKET_RANGES.append((start, end))
+        bucket_ranges.append((start, end))
         start += 10
 
-    BUCKET_LABELS = [f"{s}-{e}" for (s, e) in BUCKET_RANGES]
+    bucket_labels = [f"{s}-{e}" for (s, e) in bucket_ranges]
+    return bucket_ranges, bucket_labels
+
 
+def make_request_plan(max_positions: int, mode: str = "paged", deep_num: int = DEEP_RESULTS_PER_REQUEST):
+    """
+    Список (page, num) запитів для одного keyword.
+
+      paged: (1, 10), (2, 10), ... — PAGES сторінок по RESULTS_PER_PAGE
+      deep : найменше num із SERPER_NUM_OPTIONS, що покриває max_positions
+             (але не більше deep_num); якщо не покриває — кілька сторінок
+             по deep_num. Напр. Top-40 -> [(1, 40)], Top-200 -> [(1, 100), (2, 100)].
 
-def bucket_for_position(pos: int) -> str:
+    Позиції потім рахуються локально: (page - 1) * num + індекс.
+    """
+    if mode == "deep":
+        allowed = [n for n in SERPER_NUM_OPTIONS if n <= deep_num] or [RESULTS_PER_PAGE]
+        num = next((n for n in allowed if n >= max_positions), allowed[-1])
+    else:
+        num = RESULTS_PER_PAGE
+    pages = max(1, math.ceil(max_positions / num))
+    return [(page, num) for page in range(1, pages + 1)]
+
+
+def resolve_depth(project_config: dict):
+    """
+    Повертає (pages, max_positions) для проєкту.
+    pages має пріоритет над max_positions.
+    """
+    pages_cfg = project_config.get("pages")
+    maxpos_cfg = project_config.get("max_positions")
+
+    if pages_cfg is not None:
+        try:
+            pages = max(1, int(pages_cfg))
+        except Exception:
+            pages = 3
+        return pages, pages * RESULTS_PER_PAGE
+
+    max_positions = int(maxpos_cfg or 30)
+    return max(1, math.ceil(max_positions / RESULTS_PER_PAGE)), max_positions
+
+
+class RunContext:
+    """
+    Налаштування одного запуску проєкту. Раніше це були глобальні змінні
+    модуля (LOCATION, GL, TARGET_DOMAINS, PAGES, BUCKET_LABELS, ...), тож два
+    проєкти не могли парситись одночасно; тепер контекст передається явно.
+    """
+
+    def __init__(self, project_config: dict, now: datetime.datetime = None):
+        self.config = project_config
+        self.name = project_config.get("name", "")
+        self.location = project_config["location"]
+        self.gl = project_config["gl"]
+        self.hl = project_config["hl"]
+        self.target_domains = set(project_config["target_domains"])
+        self.targets = TargetMatcher(self.target_domains)
+        # "host" — аналітика по хостах (fr.example.co.uk окремо від shop.example.co.uk),
+        # "registrable" — по зареєстрованому домену (обидва -> example.co.uk)
+        self.domain_level = project_config.get("domain_level") or "host"
+
+        # ✅ ГОЛОВНИЙ ФІКС: pages має пріоритет над max_positions
+        self.pages, self.max_positions = resolve_depth(project_config)
+
+        self.fetch_mode = project_config.get("fetch_mode") or "paged"
+        self.request_plan = make_request_plan(
+            self.max_positions,
+            self.fetch_mode,
+            int(project_config.get("results_per_request") or DEEP_RESULTS_PER_REQUEST),
+        )
+        self.pagination = project_config.get("pagination") or "eager"
+        self.first_hit = bool(project_config.get("first_hit", False))
+
+        self.history_file = project_config["history_file"]
+        self.history_db = project_config.get("history_db") or HISTORY_DB
+
+        # Динамічні бакети під max_positions
+        self.bucket_ranges, self.bucket_labels = build_buckets(self.max_positions)
+
+        now = now or datetime.datetime.now()
+        self.timestamp = now.strftime("%Y-%m-%d %H:%M:%S")
+        self.output_prefix = project_config["output_prefix"]
+        self.output_base = f'{self.output_prefix}_{now.strftime("%Y%m%d_%H%M")}'
+        self.output_file = self.output_base + ".xlsx"
+        # "xlsx" — Excel-звіт; "csv" / "jsonl" / "parquet" — сирі results і зведення по доменах
+        self.export_formats = list(project_config.get("export_formats") or ["xlsx"])
+
+        self.keywords = [k.strip() for k in project_config["keywords"] if k.strip()]
+
+
+def bucket_for_position(ctx: RunContext, pos: int) -> str:
     """
     Повертає назву бакету для позиції, наприклад "1-3", "4-10", "31-40".
-    Якщо позиція > MAX_POSITIONS — повертає ">MAX_POSITIONS".
+    Якщо позиція > max_positions — повертає ">max_positions".
     """
-    for (start, end), label in zip(BUCKET_RANGES, BUCKET_LABELS):
+    for (start, end), label in zip(ctx.bucket_ranges, ctx.bucket_labels):
         if start <= pos <= end:
             return label
-    return f">{MAX_POSITIONS}"
+    return f">{ctx.max_positions}"
 
 
-def calculate_success_score(stats: dict) -> int:
+def calculate_success_score(ctx: RunContext, stats: dict) -> int:
     """
     Рахує "Score" для домену, використовуючи ваги по бакетах:
       1-й бакет: 100
@@ -113,7 +251,7 @@ def calculate_success_score(stats: dict) -> int:
       решта    : 1
     """
     score = 0
-    for i, label in enumerate(BUCKET_LABELS):
+    for i, label in enumerate(ctx.bucket_labels):
         if i == 0:
             w = 100
         elif i == 1:
@@ -129,163 +267,780 @@ def calculate_success_score(stats: dict) -> int:
 
 
 # =========================
-# API Key Manager
+# Темп запитів (rate policy)
 # =========================
-class APIKeyManager:
-    def __init__(self, keys):
-        self.keys = keys
-        self.current_index = 0
+class RatePolicy:
+    """
+    Розносить старти запитів у часі: не більше requests_per_second
+    запитів за секунду + випадковий джитер до jitter секунд.
+    Замінює фіксований sleep 0.4–0.9 с після кожного keyword.
+    """
+
+    def __init__(self, requests_per_second: float = REQUESTS_PER_SECOND, jitter: float = 0.0):
+        self.interval = 1.0 / requests_per_second if requests_per_second and requests_per_second > 0 else 0.0
+        self.jitter = max(0.0, float(jitter or 0.0))
+        self.next_slot = 0.0
         self.lock = asyncio.Lock()
-        self.key_fail_counts = defaultdict(int)
-        self.max_fails_per_key = 3
 
-    async def get_current_key(self):
-        async with self.lock:
-            return self.keys[self.current_index]
+    @classmethod
+    def from_config(cls, project_config: dict, default_rps: float = REQUESTS_PER_SECOND) -> "RatePolicy":
+        """
+        rate_limit у проєкті:
+          {"requests_per_second": 5, "jitter": 0.2}
+        requests_per_second = 0 — без обмеження темпу.
+        """
+        cfg = project_config.get("rate_limit") or {}
+        return cls(
+            requests_per_second=float(cfg.get("requests_per_second", default_rps)),
+            jitter=float(cfg.get("jitter", 0.0)),
+        )
 
-    async def get_current_index(self):
+    async def wait(self):
         async with self.lock:
-            return self.current_index
+            loop = asyncio.get_running_loop()
+            now = loop.time()
+            slot = max(now, self.next_slot)
+            self.next_slot = slot + self.interval
+        delay = slot - now
+        if self.jitter:
+            delay += random.uniform(0, self.jitter)
+        if delay > 0:
+            await asyncio.sleep(delay)
 
-    async def rotate_key(self):
-        async with self.lock:
-            initial_index = self.current_index
-            attempts = 0
-            while attempts < len(self.keys):
-                self.current_index = (self.current_index + 1) % len(self.keys)
-                attempts += 1
-                if self.key_fail_counts[self.current_index] < self.max_fails_per_key:
-                    print(f"Перехід на ключ #{self.current_index + 1}")
-                    return True
-                if self.current_index == initial_index:
-                    break
-            print("Всі ключі вичерпано — чекаємо 60 сек...")
-            await asyncio.sleep(60)
-            self.key_fail_counts.clear()
-            self.current_index = 0
-            return True
-
-    async def mark_key_failed(self):
-        async with self.lock:
-            self.key_fail_counts[self.current_index] += 1
-            print(
-                f"Помилка ключа #{self.current_index + 1} "
-                f"({self.key_fail_counts[self.current_index]}/3)"
-            )
+
+# =========================
+# Адаптивна паралельність (AIMD)
+# =========================
+class AdaptiveLimiter:
+    """
+    Ліміт одночасних запитів, що підлаштовується під відповідь API (AIMD):
+      - успіх з латентністю <= latency_target: +1 до ліміту за кожні
+        `limit` успішних запитів (адитивне зростання);
+      - 429 / 5xx / таймаут: ліміт ділиться навпіл (мультиплікативне падіння),
+        не частіше ніж раз на cooldown секунд.
+
+    Використовується як семафор: `async with limiter: ...` або
+    `async with limiter.slot(owner): ...`. Один лімітер може бути спільним
+    для кількох проєктів (див. SerpRuntime): коли слот звільняється, його
+    отримує наступний по колу owner, у якого є черга, — тож великий проєкт
+    не витісняє малий.
+
+    Поточний ліміт і середня латентність — limiter.limit / limiter.latency.
+    """
+
+    def __init__(
+        self,
+        initial: int = MAX_CONCURRENT_REQUESTS,
+        min_limit: int = MIN_CONCURRENT_REQUESTS,
+        max_limit: int = MAX_CONCURRENT_REQUESTS_LIMIT,
+        latency_target: float = LATENCY_TARGET,
+        cooldown: float = 2.0,
+    ):
+        self.min_limit = max(1, int(min_limit))
+        self.max_limit = max(self.min_limit, int(max_limit))
+        self.latency_target = float(latency_target)
+        self.cooldown = float(cooldown)
+        self._limit = float(min(max(int(initial), self.min_limit), self.max_limit))
+        self.in_flight = 0
+        self.latency = None        # EWMA латентності успішних запитів, сек
+        self.requests = 0
+        self.overloads = 0
+        self._last_decrease = 0.0
+        self._waiters = {}         # owner -> deque(future)
+        self._turns = deque()      # owners з чергою, по колу
+
+    @classmethod
+    def from_config(cls, project_config: dict) -> "AdaptiveLimiter":
+        """
+        concurrency у проєкті:
+          {"initial": 3, "min": 1, "max": 12, "latency_target": 3.0}
+        """
+        cfg = project_config.get("concurrency") or {}
+        return cls(
+            initial=int(cfg.get("initial", MAX_CONCURRENT_REQUESTS)),
+            min_limit=int(cfg.get("min", MIN_CONCURRENT_REQUESTS)),
+            max_limit=int(cfg.get("max", MAX_CONCURRENT_REQUESTS_LIMIT)),
+            latency_target=float(cfg.get("latency_target", LATENCY_TARGET)),
+        )
+
+    @property
+    def limit(self) -> int:
+        return int(self._limit)
+
+    async def acquire(self, owner=None):
+        if self.in_flight < self.limit and not self._turns:
+            self.in_flight += 1
+            return
+        fut = asyncio.get_running_loop().create_future()
+        if owner not in self._waiters:
+            self._waiters[owner] = deque()
+            self._turns.append(owner)
+        self._waiters[owner].append(fut)
+        try:
+            await fut
+        except asyncio.CancelledError:
+            if fut.done() and not fut.cancelled():
+                # слот уже видали — повертаємо
+                self.release()
+            raise
+
+    def release(self):
+        self.in_flight -= 1
+        self._wake()
+
+    def _wake(self):
+        while self.in_flight < self.limit and self._turns:
+            owner = self._turns.popleft()
+            queue = self._waiters[owner]
+            fut = queue.popleft()
+            if queue:
+                self._turns.append(owner)
+            else:
+                del self._waiters[owner]
+            if fut.cancelled():
+                continue
+            self.in_flight += 1
+            fut.set_result(None)
+
+    @contextlib.asynccontextmanager
+    async def slot(self, owner=None):
+        await self.acquire(owner)
+        try:
+            yield self
+        finally:
+            self.release()
+
+    async def __aenter__(self):
+        await self.acquire()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self.release()
+
+    def record_success(self, latency: float):
+        self.requests += 1
+        if self.latency is None:
+            self.latency = latency
+        else:
+            self.latency = 0.8 * self.latency + 0.2 * latency
+        if self.latency <= self.latency_target and self._limit < self.max_limit:
+            self._limit = min(self.max_limit, self._limit + 1.0 / self._limit)
+            self._wake()
+
+    def record_overload(self):
+        self.requests += 1
+        self.overloads += 1
+        now = asyncio.get_running_loop().time()
+        if now - self._last_decrease < self.cooldown:
+            return
+        self._last_decrease = now
+        new_limit = max(self.min_limit, self._limit / 2)
+        if int(new_limit) < self.limit:
+            print(f"\nПеревантаження API — паралельність {self.limit} -> {int(new_limit)}")
+        self._limit = new_limit
+
+    def stats(self) -> dict:
+        return {
+            "limit": self.limit,
+            "in_flight": self.in_flight,
+            "latency": round(self.latency, 3) if self.latency is not None else None,
+            "requests": self.requests,
+            "overloads": self.overloads,
+        }
+
+
+# =========================
+# Пул API-ключів
+# =========================
+class KeyState:
+    """
+    Стан одного API-ключа: token bucket, пауза (cooldown), вичерпаність,
+    витрачені/залишкові кредити. Один на ключ у процесі (див. KeyStates),
+    тож проєкти з тим самим ключем ділять і темп, і паузи.
+    """
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.refilled_at = time.monotonic()
+        self.cooldown_until = 0.0            # time.time(), щоб переживало рестарт
+        self.fail_count = 0
+        self.exhausted = False
+        self.credits_used = 0
+        self.balance = None                  # залишок кредитів, якщо відомий
+        self.balance_checked = 0.0           # коли востаннє питали /account
+        self.changed = 0.0                   # коли востаннє змінювались пауза/вичерпаність
+        # токени беруть цикли подій різних потоків (фонові задачі Streamlit)
+        self.lock = threading.Lock()
+
+    def refill(self, now: float):
+        elapsed = now - self.refilled_at
+        self.tokens = min(self.burst, self.tokens + elapsed * self.rate)
+        self.refilled_at = now
+
+    def set_cooldown(self, until: float, exhausted: bool = None):
+        self.cooldown_until = until
+        if exhausted is not None:
+            self.exhausted = exhausted
+        self.changed = time.time()
+
+    def restore(self, st: dict):
+        """Підтягує збережений стан; свіжіша пауза з файлу (інший процес) перемагає."""
+        until = float(st.get("cooldown_until", 0))
+        if until > time.time() and float(st.get("changed", 0)) >= self.changed:
+            self.cooldown_until = until
+            self.exhausted = bool(st.get("exhausted"))
+            self.changed = float(st.get("changed", 0))
+        self.credits_used = max(self.credits_used, int(st.get("credits_used", 0)))
+        if self.balance is None:
+            self.balance = st.get("balance")
+
+    def snapshot(self) -> dict:
+        return {
+            "cooldown_until": self.cooldown_until,
+            "exhausted": self.exhausted,
+            "fail_count": self.fail_count,
+            "credits_used": self.credits_used,
+            "balance": self.balance,
+            "changed": self.changed,
+            "updated": datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        }
+
+
+class KeyStates:
+    """
+    Реєстр стану API-ключів: один KeyState на відбиток ключа для всіх
+    пулів (проєктів) і рантаймів процесу — одночасні запуски з тим самим
+    ключем не перевищують його темп і бачать паузи / вичерпаність, які
+    помітив інший проєкт.
+
+    Файл стану (KEY_STATE_FILE) читається при старті рантайму і пишеться
+    цілком, атомарно (тимчасовий файл + os.replace); пауза, записана
+    іншим процесом пізніше, при злитті не затирається.
+    """
+
+    _registries = {}
+    _registries_lock = threading.Lock()
+
+    def __init__(self, state_file: str = KEY_STATE_FILE):
+        self.state_file = state_file
+        self.states = {}
+        self.persisted = {}
+        self.lock = threading.Lock()
+        self.load()
+
+    @classmethod
+    def shared(cls, state_file: str = KEY_STATE_FILE) -> "KeyStates":
+        """Реєстр процесу для state_file."""
+        with cls._registries_lock:
+            if state_file not in cls._registries:
+                cls._registries[state_file] = cls(state_file)
+            return cls._registries[state_file]
+
+    @staticmethod
+    def key_id(key: str) -> str:
+        # у файл стану пишемо не сам ключ, а його відбиток
+        return hashlib.sha1(key.encode("utf-8")).hexdigest()[:16]
+
+    def _read_file(self) -> dict:
+        try:
+            with open(self.state_file, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except Exception as e:
+            print(f"Не вдалося прочитати стан ключів: {e}")
+            return {}
+
+    def get(self, key: str, rate: float, burst: float) -> KeyState:
+        """
+        Спільний стан ключа. Якщо проєкти задають ключу різні key_limits —
+        діє суворіший.
+        """
+        kid = self.key_id(key)
+        with self.lock:
+            st = self.states.get(kid)
+            if st is None:
+                st = self.states[kid] = KeyState(rate, burst)
+                if kid in self.persisted:
+                    st.restore(self.persisted[kid])
+            else:
+                with st.lock:
+                    st.rate = min(st.rate, rate)
+                    st.burst = min(st.burst, burst)
+                    st.tokens = min(st.tokens, st.burst)
+            return st
+
+    def load(self):
+        """Перечитує файл стану (зміни інших процесів) у вже відомі ключі."""
+        persisted = self._read_file()
+        with self.lock:
+            self.persisted = persisted
+            for kid, st in self.states.items():
+                if kid in persisted:
+                    st.restore(persisted[kid])
+
+    def save(self):
+        with self.lock:
+            state = self._read_file()
+            for kid, st in self.states.items():
+                entry = st.snapshot()
+                old = state.get(kid) or {}
+                if float(old.get("changed", 0)) > st.changed:
+                    # пауза, яку інший процес поставив пізніше за нашу зміну
+                    for field in ("cooldown_until", "exhausted", "changed"):
+                        entry[field] = old.get(field, entry[field])
+                state[kid] = entry
+            self.persisted = state
+            tmp = f"{self.state_file}.{os.getpid()}.{threading.get_ident()}.tmp"
+            try:
+                with open(tmp, "w", encoding="utf-8") as f:
+                    json.dump(state, f, ensure_ascii=False, indent=2)
+                os.replace(tmp, self.state_file)
+            except Exception as e:
+                print(f"Не вдалося зберегти стан ключів: {e}")
+                with contextlib.suppress(OSError):
+                    os.remove(tmp)
+
+
+class APIKeyPool:
+    """
+    Роздає запити по всіх здорових ключах проєкту (round-robin),
+    кожен ключ має власний token bucket і дедлайн паузи (cooldown).
+
+    Замість глобального sleep(60) під локом: якщо зараз немає
+    вільного ключа, acquire() чекає до найближчого токена/дедлайну
+    вже без локу, тож інші воркери не блокуються.
+
+    Стан ключів — спільні KeyState з реєстру KeyStates: пули різних
+    проєктів з тим самим ключем ділять один bucket і паузи. Реєстр
+    зберігає стан у KEY_STATE_FILE між запусками.
+    """
+
+    def __init__(
+        self,
+        keys,
+        requests_per_second: float = KEY_REQUESTS_PER_SECOND,
+        burst: float = KEY_BURST,
+        state_file: str = KEY_STATE_FILE,
+        key_states: KeyStates = None,
+    ):
+        self.keys = [k for k in keys if k]
+        self.rate = max(0.01, float(requests_per_second))
+        self.burst = max(1.0, float(burst))
+        self.key_states = key_states or KeyStates.shared(state_file)
+        self.states = [self.key_states.get(k, self.rate, self.burst) for k in self.keys]
+        self._next = 0
+
+    @classmethod
+    def from_config(cls, project_config: dict, key_states: KeyStates = None) -> "APIKeyPool":
+        """
+        key_limits у проєкті:
+          {"requests_per_second": 5, "burst": 5}
+        """
+        cfg = project_config.get("key_limits") or {}
+        return cls(
+            project_config["api_keys"],
+            requests_per_second=float(cfg.get("requests_per_second", KEY_REQUESTS_PER_SECOND)),
+            burst=float(cfg.get("burst", KEY_BURST)),
+            key_states=key_states,
+        )
+
+    def save_state(self):
+        self.key_states.save()
+
+    async def acquire(self, cost: float = 1.0):
+        """
+        Повертає (індекс, ключ) або (None, None), якщо всі ключі
+        на паузі довше за KEY_MAX_WAIT.
+        """
+        n = len(self.keys)
+        if n == 0:
+            return None, None
+        while True:
+            now_wall = time.time()
+            now = time.monotonic()
+            wait = None
+            for offset in range(n):
+                i = (self._next + offset) % n
+                st = self.states[i]
+                with st.lock:
+                    if st.cooldown_until > now_wall:
+                        delay = st.cooldown_until - now_wall
+                    else:
+                        st.refill(now)
+                        # батч дорожчий за burst чекає лише повного bucket (інакше не дочекався б),
+                        # але списується повністю: токени йдуть у мінус, і наступні запити
+                        # ключа чекають, поки борг відновиться, — темп ключа тримається
+                        need = min(float(cost), st.burst)
+                        if st.tokens >= need:
+                            st.tokens -= float(cost)
+                            self._next = (i + 1) % n
+                            return i, self.keys[i]
+                        delay = (need - st.tokens) / st.rate
+                wait = delay if wait is None else min(wait, delay)
+            if wait > KEY_MAX_WAIT:
+                return None, None
+            await asyncio.sleep(wait)
+
+    def report_success(self, i: int, credits=None):
+        credits = int(credits or 1)
+        st = self.states[i]
+        with st.lock:
+            st.fail_count = 0
+            st.credits_used += credits
+            if st.balance is not None:
+                st.balance = max(0, st.balance - credits)
+
+    def report_failure(self, i: int, status: int, message: str = ""):
+        """
+        429 — ключ у паузі KEY_COOLDOWN_RATE_LIMIT * 2^(fails-1);
+        401/403 або повідомлення про кредити — ключ вичерпано/невалідний,
+        пауза KEY_COOLDOWN_EXHAUSTED (зберігається між запусками).
+        """
+        st = self.states[i]
+        now = time.time()
+        with st.lock:
+            st.fail_count += 1
+            if status in (401, 403) or "credit" in (message or "").lower():
+                st.balance = 0 if "credit" in (message or "").lower() else st.balance
+                st.set_cooldown(now + KEY_COOLDOWN_EXHAUSTED, exhausted=True)
+                exhausted = True
+            else:
+                pause = min(KEY_COOLDOWN_EXHAUSTED, KEY_COOLDOWN_RATE_LIMIT * 2 ** (st.fail_count - 1))
+                st.set_cooldown(max(st.cooldown_until, now + pause))
+                st.tokens = min(st.tokens, 0.0)   # борг батча 429 не списує
+                exhausted = False
+        if exhausted:
+            print(f"Ключ #{i + 1} вичерпано/заблоковано — пауза {KEY_COOLDOWN_EXHAUSTED // 3600} год")
+            self.save_state()
+        else:
+            print(f"Ключ #{i + 1}: HTTP {status} — пауза {int(pause)}с ({st.fail_count}-а помилка поспіль)")
+
+    async def refresh_balances(self, session: aiohttp.ClientSession):
+        """
+        Оновлює залишок кредитів по кожному ключу (запит до акаунта
+        кредитів не витрачає). Ключ з нульовим балансом ставиться на паузу.
+        Ключ, який щойно перевірив інший проєкт, повторно не питаємо.
+        """
+        for i, key in enumerate(self.keys):
+            st = self.states[i]
+            if time.time() - st.balance_checked < KEY_BALANCE_TTL:
+                continue
+            st.balance_checked = time.time()
+            try:
+                async with session.get(ACCOUNT_URL, headers={"X-API-KEY": key}, timeout=10) as r:
+                    if r.status != 200:
+                        continue
+                    data = await r.json()
+            except Exception:
+                continue
+            balance = data.get("balance")
+            if balance is None:
+                continue
+            with st.lock:
+                st.balance = int(balance)
+                if st.balance <= 0:
+                    st.set_cooldown(time.time() + KEY_COOLDOWN_EXHAUSTED, exhausted=True)
+                elif st.exhausted:
+                    # ключ поповнили — знімаємо паузу
+                    st.set_cooldown(0.0, exhausted=False)
+
+    def healthy_count(self) -> int:
+        now = time.time()
+        return sum(1 for st in self.states if st.cooldown_until <= now)
 
 
 # =========================
 # Пошук
 # =========================
-async def serper_search_async(
-    query: str,
-    page: int,
+def build_payload(ctx: RunContext, query: str, page: int, num: int = RESULTS_PER_PAGE) -> dict:
+    return {
+        "q": query,
+        "location": ctx.location,
+        "gl": ctx.gl,
+        "hl": ctx.hl,
+        "num": num,
+        "page": page,
+    }
+
+
+async def serper_post_async(
+    payload,
+    label: str,
     session: aiohttp.ClientSession,
-    semaphore: asyncio.Semaphore,
-    api_key_manager: APIKeyManager,
+    limiter: AdaptiveLimiter,
+    key_pool: APIKeyPool,
+    owner=None,
 ):
+    """
+    Один POST до Serper з ретраями, ротацією ключів і AIMD-лімітом.
+    payload — dict (один запит) або list (батч). Повертає JSON відповіді або None.
+    owner — хто займає слот спільного лімітера (для справедливої черги).
+    """
     backoff = 1.0
     max_backoff = 16.0
-    max_retries = len(api_key_manager.keys) * 3
+    max_retries = len(key_pool.keys) * 3
     retry_count = 0
+    cost = len(payload) if isinstance(payload, list) else 1
 
-    async with semaphore:
-        while retry_count < max_retries:
-            current_key = await api_key_manager.get_current_key()
-            current_idx = await api_key_manager.get_current_index()
-
-            headers = {
-                "X-API-KEY": current_key,
-                "Content-Type": "application/json",
-            }
-            payload = {
-                "q": query,
-                "location": LOCATION,
-                "gl": GL,
-                "hl": HL,
-                "num": RESULTS_PER_PAGE,
-                "page": page,
-            }
+    while retry_count < max_retries:
+        current_idx, current_key = await key_pool.acquire(cost)
+        if current_key is None:
+            print(f"\nВсі ключі вичерпано або на паузі — пропускаю {label}")
+            return None
 
-            try:
+        headers = {
+            "X-API-KEY": current_key,
+            "Content-Type": "application/json",
+        }
+
+        try:
+            async with limiter.slot(owner):
+                started = asyncio.get_running_loop().time()
                 async with session.post(
-                    BASE_URL, json=payload, headers=headers, timeout=30
+                    BASE_URL, json=payload, headers=headers, timeout=30 + 5 * (cost - 1)
                 ) as r:
-                    if r.status == 200:
+                    status = r.status
+                    if status == 200:
                         data = await r.json()
-                        organic_count = len(data.get("organic", []))
-                        print(f"\n'{query}' стор.{page}: {organic_count} результатів")
-                        return data
-
-                    if r.status in (403, 429):
+                        limiter.record_success(asyncio.get_running_loop().time() - started)
+                    elif status in (400, 401, 403, 429):
                         try:
                             err = await r.json()
                             msg = err.get("message", str(err))[:200]
                         except Exception:
                             msg = (await r.text())[:200]
-                        print(f"\nHTTP {r.status} (ключ #{current_idx+1}): {msg}")
-                        await api_key_manager.mark_key_failed()
-                        if await api_key_manager.rotate_key():
-                            await asyncio.sleep(backoff)
-                            backoff = min(max_backoff, backoff * 2)
-                            retry_count += 1
-                            continue
-
-                    if r.status >= 500:
-                        print(f"\nСерверна помилка {r.status} — повтор через {backoff}с")
-                        await asyncio.sleep(backoff)
-                        backoff = min(max_backoff, backoff * 2)
-                        retry_count += 1
-                        continue
-
-                    print(f"\nHTTP {r.status}")
-                    return None
-
-            except asyncio.TimeoutError:
-                print(f"\nТаймаут '{query}'")
-                await asyncio.sleep(backoff)
-                backoff = min(max_backoff, backoff * 2)
+                        if status == 429:
+                            limiter.record_overload()
+                    elif status >= 500:
+                        limiter.record_overload()
+
+            if status == 200:
+                if isinstance(data, list):
+                    credits = sum(int(d.get("credits") or 1) for d in data if isinstance(d, dict))
+                else:
+                    credits = data.get("credits")
+                key_pool.report_success(current_idx, credits)
+                return data
+
+            if status in (401, 403, 429) or (status == 400 and "credit" in msg.lower()):
+                print(f"\nHTTP {status} (ключ #{current_idx+1}): {msg}")
+                key_pool.report_failure(current_idx, status, msg)
+                # інші ключі пулу можуть бути вільні — повтор без backoff
                 retry_count += 1
-            except Exception as e:
-                print(f"\nПомилка '{query}': {e}")
+                continue
+
+            if status >= 500:
+                print(f"\nСерверна помилка {status} — повтор через {backoff}с")
                 await asyncio.sleep(backoff)
                 backoff = min(max_backoff, backoff * 2)
                 retry_count += 1
+                continue
 
-        print(f"\nПеревищено спроби для '{query}'")
-        return None
+            print(f"\nHTTP {status}")
+            return None
+
+        except asyncio.TimeoutError:
+            limiter.record_overload()
+            print(f"\nТаймаут {label}")
+            await asyncio.sleep(backoff)
+            backoff = min(max_backoff, backoff * 2)
+            retry_count += 1
+        except Exception as e:
+            print(f"\nПомилка {label}: {e}")
+            await asyncio.sleep(backoff)
+            backoff = min(max_backoff, backoff * 2)
+            retry_count += 1
+
+    print(f"\nПеревищено спроби для {label}")
+    return None
 
 
-async def process_keyword(
-    kw: str,
+async def serper_search_async(
+    ctx: RunContext,
+    query: str,
+    page: int,
     session: aiohttp.ClientSession,
-    semaphore: asyncio.Semaphore,
-    api_key_manager: APIKeyManager,
+    limiter: AdaptiveLimiter,
+    key_pool: APIKeyPool,
+    num: int = RESULTS_PER_PAGE,
+):
+    data = await serper_post_async(
+        build_payload(ctx, query, page, num), f"'{query}'", session, limiter, key_pool, owner=ctx.name
+    )
+    if isinstance(data, dict):
+        organic_count = len(data.get("organic", []))
+        print(f"\n'{query}' стор.{page}: {organic_count} результатів")
+        return data
+    return None
+
+
+async def serper_search_batch_async(
+    ctx: RunContext,
+    jobs: list,
+    session: aiohttp.ClientSession,
+    limiter: AdaptiveLimiter,
+    key_pool: APIKeyPool,
 ):
     """
-    Парсимо keyword до MAX_POSITIONS (Top N),
-    розкидаємо по сторінках 1..PAGES (де PAGES = ceil(MAX_POSITIONS / RESULTS_PER_PAGE))
+    Кілька запитів (query, page, num) одним POST — Serper приймає масив
+    об'єктів запиту і повертає масив відповідей у тому ж порядку.
+    Повертає список відповідей (None для тих, що не вдалися).
     """
-    tasks = []
-    for page in range(1, PAGES + 1):
-        tasks.append(
-            serper_search_async(kw, page, session, semaphore, api_key_manager)
-        )
+    payload = [build_payload(ctx, query, page, num) for query, page, num in jobs]
+    data = await serper_post_async(
+        payload, f"батч з {len(jobs)} запитів", session, limiter, key_pool, owner=ctx.name
+    )
+    if not isinstance(data, list) or len(data) != len(jobs):
+        return [None] * len(jobs)
+    results = []
+    for item in data:
+        if isinstance(item, dict) and "error" not in item and "message" not in item:
+            results.append(item)
+        else:
+            results.append(None)
+    print(f"\nБатч: {sum(1 for r in results if r is not None)}/{len(jobs)} запитів успішно")
+    return results
+
 
-    results = await asyncio.gather(*tasks, return_exceptions=True)
+class SerperBatcher:
+    """
+    Збирає одиночні запити воркерів у батчі до batch_size
+    (або що назбиралось за max_delay секунд) і шле їх одним POST.
+    Відповідь розкладається назад по job-ах; ті, що не вдалися
+    в батчі, повторюються поодинці через serper_search_async.
+
+    Темп (RatePolicy) тут рахується на HTTP-запит, а не на keyword.
+    """
+
+    def __init__(
+        self,
+        ctx: RunContext,
+        session: aiohttp.ClientSession,
+        limiter: AdaptiveLimiter,
+        key_pool: APIKeyPool,
+        rate_policy: RatePolicy,
+        batch_size: int = BATCH_SIZE,
+        max_delay: float = BATCH_MAX_DELAY,
+    ):
+        self.ctx = ctx
+        self.session = session
+        self.limiter = limiter
+        self.key_pool = key_pool
+        self.rate_policy = rate_policy
+        self.batch_size = max(1, int(batch_size))
+        self.max_delay = max_delay
+        self.pending = []          # (query, page, num, future)
+        self.timer = None
+        self.tasks = set()
+        self.batches = 0
+
+    async def search(self, query: str, page: int, num: int = RESULTS_PER_PAGE):
+        fut = asyncio.get_running_loop().create_future()
+        self.pending.append((query, page, num, fut))
+        if len(self.pending) >= self.batch_size:
+            self._flush()
+        elif self.timer is None:
+            self.timer = asyncio.get_running_loop().call_later(self.max_delay, self._flush)
+        return await fut
+
+    def _flush(self):
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        while self.pending:
+            batch = self.pending[: self.batch_size]
+            self.pending = self.pending[self.batch_size:]
+            task = asyncio.create_task(self._send(batch))
+            self.tasks.add(task)
+            task.add_done_callback(self.tasks.discard)
+
+    async def _send(self, batch: list):
+        jobs = [(q, p, n) for q, p, n, _ in batch]
+        try:
+            await self.rate_policy.wait()
+            if len(jobs) == 1:
+                query, page, num = jobs[0]
+                results = [
+                    await serper_search_async(
+                        self.ctx, query, page, self.session, self.limiter, self.key_pool, num=num
+                    )
+                ]
+            else:
+                self.batches += 1
+                results = await serper_search_batch_async(
+                    self.ctx, jobs, self.session, self.limiter, self.key_pool
+                )
+                failed = [i for i, r in enumerate(results) if r is None]
+                if failed:
+                    print(f"\nБатч: {len(failed)} запитів повторюю поодинці")
+                    retried = await asyncio.gather(
+                        *[
+                            serper_search_async(self.ctx, q, p, self.session, self.limiter, self.key_pool, num=n)
+                            for q, p, n in (jobs[i] for i in failed)
+                        ],
+                        return_exceptions=True,
+                    )
+                    for i, data in zip(failed, retried):
+                        results[i] = data if isinstance(data, dict) else None
+        except Exception as e:
+            print(f"\nПомилка батчу: {e}")
+            results = [None] * len(batch)
+        for (_, _, _, fut), data in zip(batch, results):
+            if not fut.done():
+                fut.set_result(data)
+
+    async def close(self):
+        self._flush()
+        while self.tasks:
+            await asyncio.gather(*list(self.tasks), return_exceptions=True)
+
+
+def should_fetch_next_page(ctx: RunContext, data, num: int) -> bool:
+    """
+    Lazy-пагінація: чи є сенс просити наступну сторінку після цієї.
+    Ні — якщо запит не вдався, сторінка коротка (далі буде порожньо
+    або дублікати) або (ctx.first_hit) на ній уже є таргет.
+    """
+    if not isinstance(data, dict) or "error" in data or "message" in data:
+        return False
+    items = data.get("organic", [])
+    if len(items) < max(1, math.ceil(num * LAZY_FULL_PAGE_RATIO)):
+        return False
+    if ctx.first_hit:
+        for item in items:
+            link = item.get("link", "")
+            if link and is_target_domain(ctx, get_full_domain(link)):
+                return False
+    return True
+
+
+def fetch_failed(data) -> bool:
+    """Запит не дав видачі (мережа, 4xx/5xx після повторів, ключі вичерпано) — це не порожня видача."""
+    if data is None or isinstance(data, Exception):
+        return True
+    return isinstance(data, dict) and ("error" in data or "message" in data)
+
+
+def parse_keyword_results(ctx: RunContext, kw: str, results: list, plan=None) -> list:
+    """
+    Розбирає відповіді запитів з plan (за замовчуванням ctx.request_plan;
+    results[i] — відповідь на plan[i]) у рядки keyword_data
+    з позиціями до ctx.max_positions.
+    """
     keyword_data = []
     target_found = []
 
-    for page, data in enumerate(results, 1):
-        start_pos = (page - 1) * RESULTS_PER_PAGE + 1
-        if data is None or isinstance(data, Exception):
-            continue
-        if isinstance(data, dict) and ("error" in data or "message" in data):
+    for (page, num), data in zip(plan or ctx.request_plan, results):
+        start_pos = (page - 1) * num + 1
+        if fetch_failed(data):
             continue
 
         items = data.get("organic", [])
         for idx, item in enumerate(items, start=start_pos):
-            if idx > MAX_POSITIONS:
+            if idx > ctx.max_positions:
                 break
 
             link = item.get("link", "")
@@ -293,7 +1048,9 @@ async def process_keyword(
                 continue
 
             full_domain = get_full_domain(link)
-            is_target = is_target_domain(full_domain)
+            target = ctx.targets.match(full_domain)
+            is_target = target is not None
+            domain = registrable_domain(full_domain) if ctx.domain_level == "registrable" else full_domain
 
             title = item.get("title", "") or ""
             snippet = item.get("snippet", "") or ""
@@ -302,12 +1059,13 @@ async def process_keyword(
                 {
                     "Keyword": kw,
                     "Position": idx,
-                    "Domain": full_domain,
+                    "Domain": domain,
                     "Title": title,
                     "Snippet": snippet,
                     "URL": link,
                     "Is_Target": is_target,
-                    "Bucket": bucket_for_position(idx),
+                    "Target": target,
+                    "Bucket": bucket_for_position(ctx, idx),
                 }
             )
 
@@ -323,222 +1081,558 @@ async def process_keyword(
     return keyword_data
 
 
+class SharedSerpStore:
+    """
+    Дедуплікація запитів між проєктами масового запуску.
+
+    Перед запуском for_projects() рахує, скільки проєктів чекають на кожен
+    запит (keyword, location, gl, hl, page, num). Перший, хто його зробить,
+    кладе відповідь сюди, решта беруть готову; запис видаляється, щойно
+    його забрав останній споживач. Якщо той самий запит уже летить —
+    чекаємо його замість дубля.
+    """
+
+    def __init__(self):
+        self.expected = defaultdict(int)
+        self.data = {}
+        self.inflight = {}
+        self.saved = 0
+
+    @staticmethod
+    def make_key(q: str, location: str, gl: str, hl: str, page: int, num: int) -> tuple:
+        return normalize_request(q, location, gl, hl, page, num)
+
+    @classmethod
+    def for_projects(cls, project_configs: list) -> "SharedSerpStore":
+        store = cls()
+        for cfg in project_configs:
+            _, max_positions = resolve_depth(cfg)
+            plan = make_request_plan(
+                max_positions,
+                cfg.get("fetch_mode") or "paged",
+                int(cfg.get("results_per_request") or DEEP_RESULTS_PER_REQUEST),
+            )
+            if (cfg.get("pagination") or "eager") == "lazy":
+                # глибші сторінки lazy-проєкту заздалегідь невідомі
+                plan = plan[:1]
+            for kw in cfg.get("keywords", []):
+                if not kw.strip():
+                    continue
+                for page, num in plan:
+                    key = cls.make_key(kw.strip(), cfg["location"], cfg["gl"], cfg["hl"], page, num)
+                    store.expected[key] += 1
+        total = sum(store.expected.values())
+        print(f"Масовий запуск: {len(project_configs)} проєктів, {total} запитів, унікальних {len(store.expected)}")
+        return store
+
+    async def get(self, key: tuple):
+        """
+        Готова відповідь (або результат запиту, що вже летить) чи None —
+        тоді запит робить той, хто питав, і потім викликає put().
+        """
+        if key in self.data:
+            self.saved += 1
+            return self._take(key)
+        fut = self.inflight.get(key)
+        if fut is not None and fut.get_loop() is asyncio.get_running_loop():
+            data = await fut
+            if data is not None:
+                self.saved += 1
+                self._take(key, stored=False)
+            return data
+        self.inflight[key] = asyncio.get_running_loop().create_future()
+        return None
+
+    def put(self, key: tuple, data):
+        fut = self.inflight.pop(key, None)
+        if fut is not None and not fut.done():
+            fut.set_result(data)
+        if isinstance(data, dict) and self.expected.get(key, 0) > 1:
+            self.data[key] = data
+        self._take(key, stored=False)
+
+    def _take(self, key: tuple, stored: bool = True):
+        data = self.data.get(key) if stored else None
+        self.expected[key] = self.expected.get(key, 0) - 1
+        if self.expected[key] <= 0:
+            self.expected.pop(key, None)
+            self.data.pop(key, None)
+        return data
+
+
+class SerpClient:
+    """
+    Єдина точка "дай видачу для (query, page, num)" для конвеєра:
+    спершу спільне сховище масового запуску (shared_store), потім
+    дисковий кеш (якщо cache_ttl > 0 і не force_refresh), далі — батчер
+    або одиночний запит з темпом rate_policy.
+    Свіжі відповіді пишуться в кеш навіть при force_refresh.
+    """
+
+    def __init__(
+        self,
+        ctx: RunContext,
+        session: aiohttp.ClientSession,
+        limiter: AdaptiveLimiter,
+        key_pool: APIKeyPool,
+        rate_policy: RatePolicy,
+        batcher: SerperBatcher = None,
+        cache: SerpCache = None,
+        cache_ttl: float = 0,
+        force_refresh: bool = False,
+        shared_store: SharedSerpStore = None,
+    ):
+        self.ctx = ctx
+        self.session = session
+        self.limiter = limiter
+        self.key_pool = key_pool
+        self.rate_policy = rate_policy
+        self.batcher = batcher
+        self.cache = cache if cache_ttl and cache_ttl > 0 else None
+        self.cache_ttl = cache_ttl
+        self.force_refresh = force_refresh
+        self.shared_store = shared_store
+
+    async def search(self, query: str, page: int, num: int = RESULTS_PER_PAGE):
+        if self.shared_store is None:
+            return await self._search(query, page, num)
+
+        shared_key = SharedSerpStore.make_key(query, self.ctx.location, self.ctx.gl, self.ctx.hl, page, num)
+        data = await self.shared_store.get(shared_key)
+        if data is not None:
+            return data
+        data = None
+        try:
+            data = await self._search(query, page, num)
+        finally:
+            self.shared_store.put(shared_key, data)
+        return data
+
+    async def _search(self, query: str, page: int, num: int):
+        key = None
+        if self.cache is not None:
+            key = SerpCache.make_key(query, self.ctx.location, self.ctx.gl, self.ctx.hl, page, num)
+            if not self.force_refresh:
+                data = self.cache.get(key, self.cache_ttl)
+                if data is not None:
+                    print(f"\n'{query}' стор.{page}: з кешу")
+                    return data
+
+        if self.batcher is not None:
+            data = await self.batcher.search(query, page, num)
+        else:
+            await self.rate_policy.wait()
+            data = await serper_search_async(self.ctx, query, page, self.session, self.limiter, self.key_pool, num=num)
+
+        if key is not None and isinstance(data, dict):
+            self.cache.put(key, data)
+        return data
+
+
+async def run_keyword_pipeline(
+    keywords: list,
+    client: SerpClient,
+    on_keyword_done,
+    workers: int = PIPELINE_WORKERS,
+):
+    """
+    Producer/consumer конвеєр: job-и keyword×page з усього списку
+    йдуть через пул воркерів. Черга обмежена, тож producer не випереджає
+    воркерів більше ніж на 2*workers job-ів.
+
+    Щойно для keyword зібрано відповіді на весь ctx.request_plan — викликається
+    await on_keyword_done(kw, keyword_data). Порядок завершення keywords
+    може не збігатися з порядком у списку. Якщо хоч один запит keyword
+    не вдався (fetch_failed) — on_keyword_done(kw, None): неповна видача
+    не видається за справжню.
+
+    pagination = "lazy": у чергу йде лише перша сторінка keyword, а наступні
+    воркер тягне сам одна за одною, поки should_fetch_next_page.
+
+    Кеш, батчі і темп запитів — усередині client.search.
+    """
+    workers = max(1, int(workers))
+    queue = asyncio.Queue(maxsize=workers * 2)
+    pending = {}  # індекс keyword -> {page: data}
+
+    ctx = client.ctx
+    plan = list(ctx.request_plan)
+
+    lazy = ctx.pagination == "lazy"
+
+    async def producer():
+        for kw_index, kw in enumerate(keywords):
+            for step in range(1 if lazy else len(plan)):
+                await queue.put((kw_index, kw, step))
+        for _ in range(workers):
+            await queue.put(None)
+
+    async def fetch(kw, step):
+        page, num = plan[step]
+        try:
+            return await client.search(kw, page, num)
+        except Exception as e:
+            print(f"\nПомилка '{kw}' стор.{page}: {e}")
+            return None
+
+    async def worker():
+        while True:
+            job = await queue.get()
+            if job is None:
+                return
+            kw_index, kw, step = job
+
+            if lazy:
+                results = [await fetch(kw, 0)]
+                while len(results) < len(plan) and should_fetch_next_page(ctx, results[-1], plan[len(results) - 1][1]):
+                    results.append(await fetch(kw, len(results)))
+                if any(fetch_failed(r) for r in results):
+                    await on_keyword_done(kw, None)
+                else:
+                    await on_keyword_done(kw, parse_keyword_results(ctx, kw, results, plan[: len(results)]))
+                continue
+
+            data = await fetch(kw, step)
+            pages = pending.setdefault(kw_index, {})
+            pages[step] = data
+            if len(pages) == len(plan):
+                del pending[kw_index]
+                results = [pages[i] for i in range(len(plan))]
+                if any(fetch_failed(r) for r in results):
+                    await on_keyword_done(kw, None)
+                else:
+                    await on_keyword_done(kw, parse_keyword_results(ctx, kw, results, plan))
+
+    tasks = [asyncio.create_task(producer())]
+    tasks += [asyncio.create_task(worker()) for _ in range(workers)]
+    try:
+        await asyncio.gather(*tasks)
+    finally:
+        for t in tasks:
+            t.cancel()
+
+
 # =========================
 # Допоміжні функції
 # =========================
-def style_header(ws, headers):
-    ws.append(headers)
-    for col in range(1, len(headers) + 1):
-        cell = ws.cell(row=1, column=col)
-        cell.font = Font(bold=True, color="FFFFFF")
-        cell.fill = PatternFill(
-            start_color="1F4E78", end_color="1F4E78", fill_type="solid"
-        )
-        cell.alignment = Alignment(horizontal="center", vertical="center")
+GREEN_FILL = "C6EFCE"
+RED_FILL = "FFB6C1"
 
 
-def autosize_columns(ws, max_width=100):
-    for col in ws.columns:
-        max_len = max((len(str(c.value)) if c.value else 0) for c in col)
-        ws.column_dimensions[col[0].column_letter].width = min(
-            max_len + 3, max_width
-        )
+def report_styles() -> list:
+    """
+    Іменовані стилі звіту (нові об'єкти на кожну книгу — стиль прив'язується
+    до книги при add_named_style). Клітинки лише посилаються на стиль за назвою.
+    """
+    def named(name, fill, font=None, alignment=None):
+        style = NamedStyle(name=name)
+        style.fill = fill
+        # без явного шрифту — шрифт книги за замовчуванням, як у звичайної клітинки
+        style.font = font if font is not None else copy(DEFAULT_FONT)
+        if alignment is not None:
+            style.alignment = alignment
+        return style
+
+    green = PatternFill("solid", GREEN_FILL)
+    red = PatternFill("solid", RED_FILL)
+    return [
+        named(
+            "header",
+            PatternFill(start_color="1F4E78", end_color="1F4E78", fill_type="solid"),
+            Font(bold=True, color="FFFFFF"),
+            Alignment(horizontal="center", vertical="center"),
+        ),
+        named("target", green),
+        named("target_up", green, Font(color="008000", bold=True)),
+        named("target_down", green, Font(color="FF0000", bold=True)),
+        named("lost", red),
+        named("lost_up", red, Font(color="008000", bold=True)),
+        named("lost_alert", red, Font(color="FF0000", bold=True)),
+        named("lost_keyword", red, Font(color="8B0000")),
+    ]
+
+
+def styled_row(ws, values, style: str, overrides: dict = None) -> list:
+    """Рядок write-only клітинок зі стилем style; overrides — {індекс колонки: стиль}."""
+    cells = []
+    for i, value in enumerate(values):
+        cell = WriteOnlyCell(ws, value=value)
+        cell.style = overrides.get(i, style) if overrides else style
+        cells.append(cell)
+    return cells
 
 
-def load_history():
+def column_widths(rows, widths: list = None) -> list:
+    """Максимальна довжина значення в кожній колонці (порожні й 0 — як 0)."""
+    widths = list(widths or [])
+    for row in rows:
+        for i, value in enumerate(row):
+            n = len(str(value)) if value else 0
+            if i >= len(widths):
+                widths.append(n)
+            elif n > widths[i]:
+                widths[i] = n
+    return widths
+
+
+def create_report_sheet(wb, title: str, headers: list, rows, max_width: int = 100):
+    """
+    Write-only аркуш зі стилізованим заголовком. Ширини колонок рахуються
+    наперед по rows (у write-only їх треба задати до першого рядка).
+    """
+    ws = wb.create_sheet(title)
+    for i, n in enumerate(column_widths(rows, column_widths([headers])), start=1):
+        ws.column_dimensions[get_column_letter(i)].width = min(n + 3, max_width)
+    ws.append(styled_row(ws, headers, "header"))
+    return ws
+
+
+def load_history(history_file: str, db_path: str = HISTORY_DB, project: str = ""):
+    """
+    Останні REPORT_HISTORY_RUNS запусків серії history_file (лише таргетні
+    рядки — звіту інших не треба). Старий JSON-файл історії з цим ім'ям
+    при першому зверненні імпортується в базу.
+    """
+    store = HistoryStore(db_path)
     try:
-        with open(HISTORY_FILE, "r", encoding="utf-8") as f:
-            return json.load(f)
-    except FileNotFoundError:
-        return []
+        store.ensure_imported(history_file, project)
+        return store.load(history_file)
     except Exception as e:
         print(f"Помилка завантаження історії: {e}")
         return []
+    finally:
+        store.close()
 
 
-def save_history(all_rows, timestamp):
-    history = load_history()
-    history.append(
-        {
-            "timestamp": timestamp,
-            "results": [
-                {
-                    "Keyword": r["Keyword"],
-                    "Position": r["Position"],
-                    "Domain": r["Domain"],
-                    "Title": r["Title"],
-                    "Snippet": r["Snippet"],
-                    "URL": r["URL"],
-                    "Is_Target": r["Is_Target"],
-                }
-                for r in all_rows
-            ],
-        }
-    )
-    MAX_HISTORY_ENTRIES = 10
-    if len(history) > MAX_HISTORY_ENTRIES:
-        history = history[-MAX_HISTORY_ENTRIES:]
+def save_history(
+    history_file: str, rows, timestamp, db_path: str = HISTORY_DB, project: str = "", changes=()
+):
+    """
+    Дописує запуск у базу історії; rows — ітерабельний, пишеться потоково.
+    changes — зміни таргетних пар (diff_target_positions), з них аркуш History.
+    """
+    store = HistoryStore(db_path)
     try:
-        with open(HISTORY_FILE, "w", encoding="utf-8") as f:
-            json.dump(history, f, ensure_ascii=False, indent=2)
-        print(f"Історія збережена ({len(history)} записів)")
+        store.add_run(history_file, timestamp, rows, project=project, changes=changes)
+        print(f"Історія збережена ({len(store.runs(history_file))} записів)")
     except Exception as e:
         print(f"Не вдалося зберегти історію: {e}")
+    finally:
+        store.close()
 
 
-def get_position_history(history, keyword, domain):
-    pos_hist = []
-    for entry in history:
-        ts = entry.get("timestamp", "")
-        found = False
-        for item in entry.get("results", []):
-            if item["Keyword"] == keyword and item["Domain"] == domain:
-                pos_hist.append({"timestamp": ts, "position": item["Position"]})
-                found = True
-                break
-        if not found:
-            pos_hist.append({"timestamp": ts, "position": None})
-    return pos_hist
+def load_changes(history_file: str, db_path: str = HISTORY_DB, limit: int = HISTORY_SHEET_RUNS) -> list:
+    """Зміни таргетних пар за останні limit запусків (для аркуша History)."""
+    store = HistoryStore(db_path)
+    try:
+        return store.changes(history_file, limit)
+    except Exception as e:
+        print(f"Помилка завантаження змін: {e}")
+        return []
+    finally:
+        store.close()
 
 
-def calculate_trend(hist):
-    valid = [p["position"] for p in hist if p["position"] is not None]
-    if len(valid) <= 1:
-        return "New" if valid else "No data"
-    cur, prev = valid[-1], valid[-2]
-    if cur < prev:
-        return f"Up {prev - cur}"
-    if cur > prev:
-        return f"Down {cur - prev}"
-    return "="
+def diff_target_positions(previous, target_rows) -> list:
+    """
+    Зміни таргетних пар (domain, keyword) відносно попереднього запуску:
+      new — з'явилась, lost — зникла, up / down — змінилась позиція.
+    Для пари береться перша (найкраща) позиція. Без попереднього запуску — [].
+    """
+    if previous is None:
+        return []
 
+    def first_positions(rows):
+        out = {}
+        for r in rows:
+            if r.get("Is_Target"):
+                out.setdefault((r["Domain"], r["Keyword"]), r["Position"])
+        return out
+
+    before = first_positions(previous)
+    now = first_positions(target_rows)
+    changes = []
+    for (domain, keyword), pos in now.items():
+        prev = before.get((domain, keyword))
+        if prev is None:
+            change = "new"
+        elif pos < prev:
+            change = "up"
+        elif pos > prev:
+            change = "down"
+        else:
+            continue
+        changes.append({"Keyword": keyword, "Domain": domain, "Change": change, "Prev": prev, "Position": pos})
+    for (domain, keyword), prev in before.items():
+        if (domain, keyword) not in now:
+            changes.append({"Keyword": keyword, "Domain": domain, "Change": "lost", "Prev": prev, "Position": None})
+    return changes
 
-def get_average_position(hist):
-    valid = [p["position"] for p in hist if p["position"] is not None]
-    return round(sum(valid) / len(valid), 1) if valid else None
 
+def build_position_index(history):
+    """
+    Один прохід по історії замість сканування всіх запусків для кожної пари:
+      index        — (domain, keyword) -> [позиція або None для кожного запуску history];
+      target_pairs — пари, що хоч раз були таргетними.
+    """
+    index = {}
+    target_pairs = set()
+    runs = len(history)
+    for i, entry in enumerate(history):
+        for item in entry.get("results", []):
+            key = (item["Domain"], item["Keyword"])
+            series = index.get(key)
+            if series is None:
+                series = index[key] = [None] * runs
+            if series[i] is None:
+                series[i] = item["Position"]
+            if item.get("Is_Target"):
+                target_pairs.add(key)
+    return index, target_pairs
 
-def get_best_position(hist):
-    valid = [p["position"] for p in hist if p["position"] is not None]
-    return min(valid) if valid else None
 
+def position_stats(positions):
+    """
+    Показники пари за один прохід по її ряду позицій:
+      trend ("Up N" / "Down N" / "=" / "New" / "No data"), avg, best, worst,
+      last_idx — індекс останнього запуску, де пара була (None — ніде).
+    """
+    count = total = 0
+    best = worst = last_idx = None
+    cur = prev = None
+    for i, pos in enumerate(positions):
+        if pos is None:
+            continue
+        count += 1
+        total += pos
+        best = pos if best is None else min(best, pos)
+        worst = pos if worst is None else max(worst, pos)
+        prev, cur = cur, pos
+        last_idx = i
+
+    if count <= 1:
+        trend = "New" if count else "No data"
+    elif cur < prev:
+        trend = f"Up {prev - cur}"
+    elif cur > prev:
+        trend = f"Down {cur - prev}"
+    else:
+        trend = "="
 
-def get_worst_position(hist):
-    valid = [p["position"] for p in hist if p["position"] is not None]
-    return max(valid) if valid else None
+    return {
+        "trend": trend,
+        "avg": round(total / count, 1) if count else None,
+        "best": best,
+        "worst": worst,
+        "last_idx": last_idx,
+    }
 
 
 # =========================
-# Головна функція проєкту
+# Excel-звіт
 # =========================
-async def run_project(project_config: dict, progress_callback=None) -> str:
+def domain_keyword_samples(rows, limit: int = DOMAIN_KEYWORDS_SAMPLE) -> dict:
     """
-    project_config:
-      {
-        "name": "...",
-        "location": "...",
-        "gl": "...",
-        "hl": "...",
-        "api_keys": [...],
-        "target_domains": [...],
-        "keywords": [...],
-        "pages": 5,                 <-- ✅ тепер підтримується
-        "max_positions": 30,        <-- або як раніше
-        "history_file": "...json",
-        "output_prefix": "..."
-      }
+    {домен: (кількість keywords, перші limit keywords)} для всіх доменів
+    запуску — один потоковий прохід по рядках журналу (рядки keyword
+    у ньому йдуть підряд), у пам'яті не більше limit назв на домен.
     """
-    global LOCATION, GL, HL, TARGET_DOMAINS, PAGES, MAX_POSITIONS, HISTORY_FILE, OUTPUT_FILE
-
-    LOCATION = project_config["location"]
-    GL = project_config["gl"]
-    HL = project_config["hl"]
-    TARGET_DOMAINS = set(project_config["target_domains"])
-
-    # ✅ ГОЛОВНИЙ ФІКС: pages має пріоритет над max_positions
-    pages_cfg = project_config.get("pages")
-    maxpos_cfg = project_config.get("max_positions")
-
-    if pages_cfg is not None:
-        try:
-            PAGES = max(1, int(pages_cfg))
-        except Exception:
-            PAGES = 3
-        MAX_POSITIONS = PAGES * RESULTS_PER_PAGE
-    else:
-        MAX_POSITIONS = int(maxpos_cfg or 30)
-        PAGES = max(1, math.ceil(MAX_POSITIONS / RESULTS_PER_PAGE))
-
-    HISTORY_FILE = project_config["history_file"]
-
-    # Будуємо динамічні бакети під MAX_POSITIONS
-    build_buckets(MAX_POSITIONS)
-
-    timestamp = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    timestamp_slug = datetime.datetime.now().strftime("%Y%m%d_%H%M")
-    OUTPUT_FILE = f'{project_config["output_prefix"]}_{timestamp_slug}.xlsx'
-
-    keywords = [k.strip() for k in project_config["keywords"] if k.strip()]
-
-    print("-" * 90)
-    print(
-        f"Запуск: Serper.dev | ТОП-{MAX_POSITIONS} | Гео: {LOCATION} "
-        f"+ СУБДОМЕНИ + ПОВНА ІСТОРІЯ"
-    )
-    print(f"{timestamp}")
-    print(
-        f"Ключів API: {len(project_config['api_keys'])} "
-        f"| Таргет-доменів: {len(TARGET_DOMAINS)}"
-    )
-    print(f"Ключових слів: {len(keywords)} | Вивід: {OUTPUT_FILE}")
-    print(f"Сторінок на ключ: {PAGES} (по {RESULTS_PER_PAGE} результатів)")
-    print(f"Бакети: {', '.join(BUCKET_LABELS)}")
-    print("-" * 90)
-
-    all_rows = []
-    domain_interval_counts = defaultdict(lambda: {label: 0 for label in BUCKET_LABELS})
-    domain_keywords = defaultdict(list)
+    samples = {}
+    last = {}
+    for row in rows:
+        d, kw = row["Domain"], row["Keyword"]
+        if last.get(d) == kw:
+            continue
+        last[d] = kw
+        count, sample = samples.get(d, (0, []))
+        if len(sample) < limit:
+            sample.append(kw)
+        samples[d] = (count + 1, sample)
+    return samples
 
-    api_key_manager = APIKeyManager(project_config["api_keys"])
 
-    connector = aiohttp.TCPConnector(limit_per_host=MAX_CONCURRENT_REQUESTS, ssl=False)
-    async with aiohttp.ClientSession(connector=connector) as session:
-        semaphore = asyncio.Semaphore(MAX_CONCURRENT_REQUESTS)
-        total_kw = len(keywords)
-        for i, kw in enumerate(keywords, 1):
-            keyword_data = await process_keyword(kw, session, semaphore, api_key_manager)
-            all_rows.extend(keyword_data)
+def build_domain_stats(
+    ctx: RunContext, domain_interval_counts, domain_keywords, target_rows, keyword_samples=None
+) -> list:
+    """
+    Зведення по доменах, спільне для аркушів Target Domains Stats /
+    Position Buckets і експорту:
+      [{"Domain", "Total", <бакети>..., "Score", "Is_Target", "Keywords"}, ...]
+    від більшого Score до меншого.
+
+    Keywords таргетного домену — повний список (domain_keywords); решти —
+    вибірка з keyword_samples (domain_keyword_samples): до
+    DOMAIN_KEYWORDS_SAMPLE назв і "… (+N)", якщо keywords більше.
+    """
+    # таргетність — за рядками, а не за назвою: на рівні "registrable"
+    # домен example.co.uk таргетний, якщо таргетом був хоч один його хост
+    target_domain_names = {r["Domain"] for r in target_rows}
+    domain_stats = []
+    for domain, stats in domain_interval_counts.items():
+        total = sum(stats.values())
+        if total == 0:
+            continue
+        record = {"Domain": domain, "Total": total}
+        for label in ctx.bucket_labels:
+            record[label] = stats[label]
+        record["Score"] = calculate_success_score(ctx, stats)
+        record["Is_Target"] = domain in target_domain_names
+        if record["Is_Target"] or keyword_samples is None:
+            record["Keywords"] = "; ".join(sorted(set(item["keyword"] for item in domain_keywords.get(domain, []))))
+        else:
+            count, sample = keyword_samples.get(domain, (0, []))
+            sample = sorted(set(sample))
+            record["Keywords"] = "; ".join(sample) + (f"; … (+{count - len(sample)})" if count > len(sample) else "")
+        domain_stats.append(record)
+    domain_stats.sort(key=lambda x: x["Score"], reverse=True)
+    return domain_stats
 
-            for item in keyword_data:
-                d = item["Domain"]
-                b = item["Bucket"]
-                domain_interval_counts[d][b] += 1
-                domain_keywords[d].append({"keyword": item["Keyword"], "position": item["Position"]})
 
-            if progress_callback is not None:
-                progress_callback(i, total_kw, len(all_rows))
+def build_run_summary(ctx: RunContext, domain_stats) -> dict:
+    """
+    Компактне зведення запуску для .summary.json: по кожному таргетному
+    домену — кількість keywords, бакети і Score. Бот рахує дельту між
+    запусками з двох таких файлів, не відкриваючи xlsx.
+    """
+    targets = {}
+    for d in domain_stats:
+        if not d["Is_Target"]:
+            continue
+        # як рахувала дельта зі звіту: унікальні keywords, інакше Total
+        keywords = len({k.strip() for k in d["Keywords"].split(";") if k.strip()}) or d["Total"]
+        targets[d["Domain"].strip().lower()] = {
+            "keywords": keywords,
+            "total": d["Total"],
+            "buckets": {label: d[label] for label in ctx.bucket_labels},
+            "score": d["Score"],
+        }
+    return {
+        "project": ctx.name,
+        "timestamp": ctx.timestamp,
+        "keywords": len(ctx.keywords),
+        "buckets": ctx.bucket_labels,
+        "targets": targets,
+    }
 
-            print(
-                f"\rОброблено: {i}/{total_kw} | "
-                f"Знайдено позицій: {len(all_rows)}",
-                end="",
-                flush=True,
-            )
-            await asyncio.sleep(random.uniform(0.4, 0.9))
 
-    print("\n")
-    history = load_history()
-    save_history(all_rows, timestamp)
-    target_rows = [r for r in all_rows if r["Is_Target"]]
+def write_report(ctx: RunContext, rows, target_rows, domain_stats, history, changes=()) -> str:
+    """
+    Пише Excel-звіт запуску в ctx.output_file (7 аркушів).
+    rows — функція, що повертає новий ітератор усіх рядків запуску
+    (викликається двічі: ширини колонок, потім запис Results),
+    target_rows — лише таргетні, domain_stats — див. build_domain_stats,
+    history — записи історії ДО цього запуску,
+    changes — зміни останніх запусків (load_changes) для аркуша History.
+
+    Книга write-only: рядки одразу йдуть у файл, тож пам'ять не росте
+    з розміром Results; форматування — іменовані стилі (report_styles).
+    """
 
-    # =========================
-    # Excel
-    # =========================
-    wb = Workbook()
+    wb = Workbook(write_only=True)
+    for style in report_styles():
+        wb.add_named_style(style)
 
     # 1. Results
-    ws_res = wb.active
-    ws_res.title = "Results"
     headers_res = [
         "Project",
         "Keyword",
@@ -549,69 +1643,51 @@ async def run_project(project_config: dict, progress_callback=None) -> str:
         "URL",
         "Is_Target",
     ]
-    style_header(ws_res, headers_res)
-    for row in all_rows:
-        ws_res.append(
-            [
-                project_config["name"],
-                row["Keyword"],
-                row["Position"],
-                row["Domain"],
-                row["Title"],
-                row["Snippet"],
-                row["URL"],
-                "Yes" if row["Is_Target"] else "",
-            ]
-        )
-        if row["Is_Target"]:
-            for c in range(1, 9):
-                ws_res.cell(row=ws_res.max_row, column=c).fill = PatternFill("solid", "C6EFCE")
+
+    def results_row(row):
+        return [
+            ctx.name,
+            row["Keyword"],
+            row["Position"],
+            row["Domain"],
+            row["Title"],
+            row["Snippet"],
+            row["URL"],
+            "Yes" if row["Is_Target"] else "",
+        ]
+
+    ws_res = create_report_sheet(wb, "Results", headers_res, (results_row(r) for r in rows()))
+    for row in rows():
+        values = results_row(row)
+        ws_res.append(styled_row(ws_res, values, "target") if row["Is_Target"] else values)
 
     # 2. Target Domains Stats
-    ws_target = wb.create_sheet("Target Domains Stats")
-    headers_target = ["Domain", "Total"] + BUCKET_LABELS + ["Score", "Keywords"]
-    style_header(ws_target, headers_target)
+    headers_target = ["Domain", "Total"] + ctx.bucket_labels + ["Score", "Keywords"]
 
-    target_data = []
-    for domain in set(r["Domain"] for r in target_rows):
-        stats = domain_interval_counts[domain]
-        total = sum(stats.values())
-        kw_list = "; ".join(sorted(set(item["keyword"] for item in domain_keywords[domain])))
-        score = calculate_success_score(stats)
-        row = [domain, total] + [stats[label] for label in BUCKET_LABELS] + [score, kw_list]
-        target_data.append(row)
+    def bucket_values(d):
+        return [d[label] for label in ctx.bucket_labels]
 
-    score_index = 2 + len(BUCKET_LABELS)
-    target_data.sort(key=lambda x: x[score_index], reverse=True)
+    target_data = [
+        [d["Domain"], d["Total"]] + bucket_values(d) + [d["Score"], d["Keywords"]]
+        for d in domain_stats
+        if d["Is_Target"]
+    ]
 
+    ws_target = create_report_sheet(wb, "Target Domains Stats", headers_target, target_data)
     for row in target_data:
-        ws_target.append(row)
-        for c in range(1, len(headers_target) + 1):
-            ws_target.cell(row=ws_target.max_row, column=c).fill = PatternFill("solid", "C6EFCE")
+        ws_target.append(styled_row(ws_target, row, "target"))
 
     # 3. Position Buckets
-    ws_pos = wb.create_sheet("Position Buckets")
-    headers_pos = ["Domain", "Total"] + BUCKET_LABELS + ["Score"]
-    style_header(ws_pos, headers_pos)
+    headers_pos = ["Domain", "Total"] + ctx.bucket_labels + ["Score"]
 
-    all_domains_rows = []
-    for domain, stats in domain_interval_counts.items():
-        total = sum(stats.values())
-        if total == 0:
-            continue
-        score = calculate_success_score(stats)
-        row_tuple = (domain, total, *[stats[label] for label in BUCKET_LABELS], score)
-        all_domains_rows.append(row_tuple)
-
-    all_domains_rows.sort(key=lambda x: x[2 + len(BUCKET_LABELS)], reverse=True)
-    for row in all_domains_rows:
-        ws_pos.append(row)
-        if is_target_domain(row[0]):
-            for c in range(1, len(headers_pos) + 1):
-                ws_pos.cell(row=ws_pos.max_row, column=c).fill = PatternFill("solid", "C6EFCE")
+    all_domains_rows = [
+        (d["Domain"], d["Total"], *bucket_values(d), d["Score"]) for d in domain_stats
+    ]
+    ws_pos = create_report_sheet(wb, "Position Buckets", headers_pos, all_domains_rows)
+    for d, row in zip(domain_stats, all_domains_rows):
+        ws_pos.append(styled_row(ws_pos, row, "target") if d["Is_Target"] else row)
 
     # 4. Dynamics (All Keywords)
-    ws_dyn = wb.create_sheet("Dynamics (All Keywords)")
     prev = len(history)
     headers_dyn = [
         "Domain",
@@ -626,25 +1702,24 @@ async def run_project(project_config: dict, progress_callback=None) -> str:
         "URL",
         "Title",
     ]
-    style_header(ws_dyn, headers_dyn)
 
-    all_domain_keyword_pairs = set()
-    for entry in history:
-        for item in entry.get("results", []):
-            if item.get("Is_Target"):
-                all_domain_keyword_pairs.add((item["Domain"], item["Keyword"]))
+    position_index, all_domain_keyword_pairs = build_position_index(history)
 
     current_pairs = {}
     for row in target_rows:
         all_domain_keyword_pairs.add((row["Domain"], row["Keyword"]))
         current_pairs[(row["Domain"], row["Keyword"])] = row
 
-    sorted_pairs = sorted(all_domain_keyword_pairs)
-
-    for domain, keyword in sorted_pairs:
-        hist = get_position_history(history, keyword, domain)
+    # ряд позицій і показники кожної пари — один раз, спільно для Dynamics і Lost
+    no_positions = [None] * prev
+    dynamics = []
+    for pair in sorted(all_domain_keyword_pairs):
+        positions = position_index.get(pair, no_positions)
+        dynamics.append((pair, positions, position_stats(positions)))
 
-        has_historical_position = any(p["position"] is not None for p in hist)
+    dyn_rows = []  # (значення, стиль рядка, стиль Status, стиль Trend)
+    for (domain, keyword), hist, pair_stats in dynamics:
+        has_historical_position = pair_stats["last_idx"] is not None
         is_currently_present = (domain, keyword) in current_pairs
 
         current_pos = None
@@ -657,8 +1732,7 @@ async def run_project(project_config: dict, progress_callback=None) -> str:
             current_url = current_pairs[(domain, keyword)]["URL"]
             current_title = current_pairs[(domain, keyword)]["Title"]
         elif has_historical_position:
-            last_idx = max(i for i, p in enumerate(hist) if p["position"] is not None)
-            runs_since_seen = prev - last_idx
+            runs_since_seen = prev - pair_stats["last_idx"]
 
             if runs_since_seen <= 2:
                 is_lost = True
@@ -666,11 +1740,11 @@ async def run_project(project_config: dict, progress_callback=None) -> str:
             else:
                 continue
 
-        trend = calculate_trend(hist)
-        positions = [p["position"] if p["position"] is not None else "—" for p in hist]
-        avg = get_average_position(hist)
-        best = get_best_position(hist)
-        worst = get_worst_position(hist)
+        trend = pair_stats["trend"]
+        positions = [p if p is not None else "—" for p in hist]
+        avg = pair_stats["avg"]
+        best = pair_stats["best"]
+        worst = pair_stats["worst"]
 
         status = (
             "Active"
@@ -692,27 +1766,20 @@ async def run_project(project_config: dict, progress_callback=None) -> str:
             current_title,
         ]
 
-        ws_dyn.append(row_data)
-
-        if is_lost or status == "LOST":
-            for c in range(1, len(headers_dyn) + 1):
-                cell = ws_dyn.cell(row=ws_dyn.max_row, column=c)
-                cell.fill = PatternFill("solid", "FFB6C1")
-                if c == 3:
-                    cell.font = Font(color="FF0000", bold=True)
-        else:
-            for c in range(1, len(headers_dyn) + 1):
-                cell = ws_dyn.cell(row=ws_dyn.max_row, column=c)
-                cell.fill = PatternFill("solid", "C6EFCE")
+        base = "lost" if (is_lost or status == "LOST") else "target"
+        status_style = "lost_alert" if base == "lost" else base
+        trend_style = base
+        if "Up" in str(trend):
+            trend_style = base + "_up"
+        if "Down" in str(trend):
+            trend_style = "lost_alert" if base == "lost" else "target_down"
+        dyn_rows.append((row_data, base, status_style, trend_style))
 
-        cell_trend = ws_dyn.cell(row=ws_dyn.max_row, column=5)
-        if "Up" in str(cell_trend.value):
-            cell_trend.font = Font(color="008000", bold=True)
-        if "Down" in str(cell_trend.value):
-            cell_trend.font = Font(color="FF0000", bold=True)
+    ws_dyn = create_report_sheet(wb, "Dynamics (All Keywords)", headers_dyn, (r[0] for r in dyn_rows))
+    for row_data, base, status_style, trend_style in dyn_rows:
+        ws_dyn.append(styled_row(ws_dyn, row_data, base, {2: status_style, 4: trend_style}))
 
     # 5. Lost Keywords
-    ws_lost = wb.create_sheet("Lost Keywords")
     headers_lost = [
         "Domain",
         "Keyword",
@@ -720,27 +1787,15 @@ async def run_project(project_config: dict, progress_callback=None) -> str:
         "Last Seen Date",
         "Days Since Lost",
     ]
-    style_header(ws_lost, headers_lost)
 
-    for domain, keyword in sorted_pairs:
-        hist = get_position_history(history, keyword, domain)
-
-        has_historical_position = any(p["position"] is not None for p in hist)
+    lost_rows = []
+    for (domain, keyword), hist, pair_stats in dynamics:
+        last_idx = pair_stats["last_idx"]
         is_currently_present = (domain, keyword) in current_pairs
 
-        if has_historical_position and not is_currently_present:
-            last_position = None
-            last_date = None
-            last_idx = None
-            for i, p in reversed(list(enumerate(hist))):
-                if p["position"] is not None:
-                    last_position = p["position"]
-                    last_date = p["timestamp"]
-                    last_idx = i
-                    break
-
-            if last_idx is None:
-                continue
+        if last_idx is not None and not is_currently_present:
+            last_position = hist[last_idx]
+            last_date = history[last_idx].get("timestamp", "")
 
             runs_since_seen = prev - last_idx
             if runs_since_seen > 2:
@@ -750,22 +1805,22 @@ async def run_project(project_config: dict, progress_callback=None) -> str:
             if last_date:
                 try:
                     last_dt = datetime.datetime.strptime(last_date, "%Y-%m-%d %H:%M:%S")
-                    current_dt = datetime.datetime.strptime(timestamp, "%Y-%m-%d %H:%M:%S")
+                    current_dt = datetime.datetime.strptime(ctx.timestamp, "%Y-%m-%d %H:%M:%S")
                     days_lost = (current_dt - last_dt).days
                 except Exception:
                     pass
 
-            ws_lost.append([domain, keyword, last_position or "—", last_date or "—", days_lost])
-            for c in range(1, 6):
-                ws_lost.cell(row=ws_lost.max_row, column=c).fill = PatternFill("solid", "FFB6C1")
-                ws_lost.cell(row=ws_lost.max_row, column=c).font = Font(color="8B0000")
+            lost_rows.append([domain, keyword, last_position or "—", last_date or "—", days_lost])
+
+    ws_lost = create_report_sheet(wb, "Lost Keywords", headers_lost, lost_rows)
+    for row in lost_rows:
+        ws_lost.append(styled_row(ws_lost, row, "lost_keyword"))
 
     # 6. History Summary
-    ws_hist = wb.create_sheet("History Summary")
-    headers_hist = ["Date", "Total Found", "Avg Pos"] + BUCKET_LABELS
-    style_header(ws_hist, headers_hist)
+    headers_hist = ["Date", "Total Found", "Avg Pos"] + ctx.bucket_labels
 
-    full_hist = history + [{"timestamp": timestamp, "results": all_rows}]
+    hist_rows = []
+    full_hist = history + [{"timestamp": ctx.timestamp, "results": target_rows}]
     for entry in full_hist:
         targets = [r for r in entry.get("results", []) if r.get("Is_Target")]
         if not targets:
@@ -774,22 +1829,557 @@ async def run_project(project_config: dict, progress_callback=None) -> str:
         avg_pos = round(sum(pos) / len(pos), 1) if pos else 0
 
         row = [entry.get("timestamp", "—"), len(targets), avg_pos]
-        for (start, end) in BUCKET_RANGES:
+        for (start, end) in ctx.bucket_ranges:
             row.append(sum(1 for p in pos if start <= p <= end))
+        hist_rows.append(row)
+
+    ws_hist = create_report_sheet(wb, "History Summary", headers_hist, hist_rows)
+    for row in hist_rows:
         ws_hist.append(row)
 
-    for ws in wb.worksheets:
-        autosize_columns(ws, max_width=100)
+    # 7. History — зміни таргетних пар за останні HISTORY_SHEET_RUNS запусків
+    headers_changes = ["Date", "Keyword", "Domain", "Change", "Prev", "Now"]
+    change_styles = {"new": "target", "up": "target_up", "down": "target_down", "lost": "lost"}
+
+    change_rows = [
+        [c["timestamp"], c["Keyword"], c["Domain"], c["Change"], c["Prev"] or "—", c["Position"] or "—"]
+        for c in changes
+    ]
+    ws_changes = create_report_sheet(wb, "History", headers_changes, change_rows)
+    for row in change_rows:
+        ws_changes.append(styled_row(ws_changes, row, change_styles[row[3]]))
 
     try:
-        Path(OUTPUT_FILE).parent.mkdir(parents=True, exist_ok=True)
-        wb.save(OUTPUT_FILE)
-        print(f"\nГОТОВО! Файл збережено: {OUTPUT_FILE}")
+        Path(ctx.output_file).parent.mkdir(parents=True, exist_ok=True)
+        wb.save(ctx.output_file)
+        print(f"\nГОТОВО! Файл збережено: {ctx.output_file}")
         print(
             "Аркуші: Results • Target Domains Stats • Position Buckets • "
-            "Dynamics (All Keywords) • Lost Keywords • History Summary"
+            "Dynamics (All Keywords) • Lost Keywords • History Summary • History"
         )
     except Exception as e:
         print(f"Помилка збереження: {e}")
 
-    return OUTPUT_FILE
+    return ctx.output_file
+
+
+# =========================
+# Спільні ресурси запусків
+# =========================
+class SerpRuntime:
+    """
+    Ресурси, спільні для одного або кількох одночасних запусків:
+    HTTP-сесія, AdaptiveLimiter (слоти видаються проєктам по колу),
+    дисковий кеш SERP (відкривається при першому зверненні),
+    сховище дедуплікації масового запуску, стан API-ключів (KeyStates:
+    проєкти з тим самим ключем ділять його bucket і паузи; за
+    замовчуванням — реєстр процесу, спільний і з іншими рантаймами)
+    і пул процесів, у якому будуються звіти (build_report) — цикл подій
+    тим часом вільний, а звіти кількох проєктів будуються паралельно
+    на різних ядрах.
+
+        async with SerpRuntime(limiter, shared_store) as runtime:
+            await asyncio.gather(run_project(a, runtime=runtime), run_project(b, runtime=runtime))
+    """
+
+    def __init__(
+        self,
+        limiter: AdaptiveLimiter = None,
+        shared_store: SharedSerpStore = None,
+        report_workers: int = None,
+        key_states: KeyStates = None,
+    ):
+        self.limiter = limiter or AdaptiveLimiter()
+        self.shared_store = shared_store
+        self.key_states = key_states or KeyStates.shared()
+        # окремий запуск — один процес під свій звіт
+        self.report_workers = min(REPORT_WORKERS, 1) if report_workers is None else report_workers
+        self.session = None
+        self._cache = None
+        self._report_pool = None
+
+    @classmethod
+    def for_projects(
+        cls, project_configs: list, shared_store: SharedSerpStore = None, key_states: KeyStates = None
+    ) -> "SerpRuntime":
+        """
+        Спільний лімітер на кілька проєктів: стеля — сума стель проєктів
+        (кожен і так розрахований на свої ключі), старт — найбільший зі стартових.
+        """
+        limiters = [AdaptiveLimiter.from_config(cfg) for cfg in project_configs] or [AdaptiveLimiter()]
+        limiter = AdaptiveLimiter(
+            initial=max(l.limit for l in limiters),
+            min_limit=min(l.min_limit for l in limiters),
+            max_limit=sum(l.max_limit for l in limiters),
+            latency_target=min(l.latency_target for l in limiters),
+        )
+        report_workers = min(REPORT_WORKERS, len(project_configs)) if REPORT_WORKERS > 0 else 0
+        return cls(limiter, shared_store, report_workers, key_states)
+
+    @property
+    def cache(self) -> SerpCache:
+        if self._cache is None:
+            self._cache = SerpCache()
+        return self._cache
+
+    async def build_report(self, fn, *args):
+        """
+        Виконує синхронну fn(*args) у пулі процесів (створюється при першому
+        звіті; spawn — дочірній процес не успадковує сесію, сокети і потоки).
+        report_workers=0 — у потоці цього процесу.
+        Скрипт, що запускає проєкти, має стартувати під
+        if __name__ == "__main__" (spawn імпортує його в дочірньому процесі).
+        """
+        if self._report_pool is None and self.report_workers > 0:
+            self._report_pool = ProcessPoolExecutor(
+                self.report_workers, mp_context=multiprocessing.get_context("spawn")
+            )
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._report_pool, fn, *args)
+
+    async def __aenter__(self):
+        connector = aiohttp.TCPConnector(limit_per_host=self.limiter.max_limit, ssl=False)
+        self.session = aiohttp.ClientSession(connector=connector)
+        # паузи, які за цей час поставили інші процеси
+        await asyncio.to_thread(self.key_states.load)
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.session.close()
+        await asyncio.to_thread(self.key_states.save)
+        if self._cache is not None:
+            self._cache.close()
+            self._cache = None
+        if self._report_pool is not None:
+            await asyncio.get_running_loop().run_in_executor(None, self._report_pool.shutdown)
+            self._report_pool = None
+
+
+# =========================
+# Потік результатів
+# =========================
+async def stream_keywords(
+    ctx: RunContext,
+    keywords: list = None,
+    force_refresh: bool = False,
+    shared_store: SharedSerpStore = None,
+    runtime: SerpRuntime = None,
+    queue_size: int = STREAM_QUEUE_SIZE,
+):
+    """
+    Async-генератор (keyword, rows) у порядку завершення keywords
+    (keywords за замовчуванням — ctx.keywords); rows = None — видачу
+    для keyword отримати не вдалося (див. fetch_failed).
+
+    Конвеєр працює у фоновій задачі й віддає результати через чергу
+    на queue_size keywords: поки споживач не забрав своє, воркери стоять,
+    тож повільний споживач гальмує і запити. Якщо споживач виходить
+    з циклу раніше — конвеєр скасовується.
+    """
+    cfg = ctx.config
+    if runtime is None:
+        async with SerpRuntime(AdaptiveLimiter.from_config(cfg), shared_store) as own:
+            async for item in stream_keywords(ctx, keywords, force_refresh, runtime=own, queue_size=queue_size):
+                yield item
+        return
+    if shared_store is None:
+        shared_store = runtime.shared_store
+    if keywords is None:
+        keywords = ctx.keywords
+
+    key_pool = APIKeyPool.from_config(cfg, runtime.key_states)
+    # загальний темп за замовчуванням масштабується з кількістю ключів
+    rate_policy = RatePolicy.from_config(
+        cfg, default_rps=REQUESTS_PER_SECOND * max(1, len(key_pool.keys))
+    )
+    session = runtime.session
+    limiter = runtime.limiter
+    batch_size = int(cfg.get("batch_size") or BATCH_SIZE)
+    cache_ttl = float(cfg.get("cache_ttl") or 0)
+    cache = runtime.cache if cache_ttl > 0 else None
+    # воркерів має бути не менше за стелю ліміту проєкту, інакше AIMD не буде
+    # куди рости; з батчами — ще й стільки, щоб кожен паралельний POST був повним
+    workers = int(
+        cfg.get("workers")
+        or max(PIPELINE_WORKERS, AdaptiveLimiter.from_config(cfg).max_limit) * max(1, batch_size)
+    )
+
+    queue = asyncio.Queue(maxsize=max(1, int(queue_size)))
+    finished = object()
+
+    async def on_keyword_done(kw, keyword_data):
+        await queue.put((kw, keyword_data))
+
+    async def fetch():
+        # стан ключів зберігає рантайм при закритті (один запис на всі проєкти)
+        await key_pool.refresh_balances(session)
+        print(f"Доступних ключів: {key_pool.healthy_count()}/{len(key_pool.keys)}")
+        batcher = None
+        if batch_size > 1:
+            batcher = SerperBatcher(ctx, session, limiter, key_pool, rate_policy, batch_size=batch_size)
+        client = SerpClient(
+            ctx,
+            session,
+            limiter,
+            key_pool,
+            rate_policy,
+            batcher=batcher,
+            cache=cache,
+            cache_ttl=cache_ttl,
+            force_refresh=force_refresh,
+            shared_store=shared_store,
+        )
+        await run_keyword_pipeline(keywords, client, on_keyword_done, workers=workers)
+        if batcher is not None:
+            await batcher.close()
+            print(f"\nБатчів відправлено: {batcher.batches} (по {batch_size} запитів)")
+        await queue.put(finished)
+
+    task = asyncio.create_task(fetch())
+    try:
+        while True:
+            get = asyncio.ensure_future(queue.get())
+            await asyncio.wait([get, task], return_when=asyncio.FIRST_COMPLETED)
+            if not get.done():
+                # конвеєр упав, не дійшовши до кінця черги
+                get.cancel()
+                await task
+            item = get.result()
+            if item is finished:
+                break
+            yield item
+        await task
+    finally:
+        if not task.done():
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+
+    if cache is not None:
+        cache_stats = cache.stats()
+        print(
+            f"\nКеш SERP: {cache_stats['hits']} влучань / {cache_stats['misses']} промахів "
+            f"({cache_stats['size_mb']} MB)"
+        )
+    stats = limiter.stats()
+    print(
+        f"\nПаралельність: {stats['limit']} (діапазон {limiter.min_limit}-{limiter.max_limit}) | "
+        f"Середня латентність: {stats['latency']}с | "
+        f"Запитів: {stats['requests']}, перевантажень: {stats['overloads']}"
+    )
+
+
+async def stream_project(
+    project_config: dict,
+    force_refresh: bool = False,
+    shared_store: SharedSerpStore = None,
+    runtime: SerpRuntime = None,
+    queue_size: int = STREAM_QUEUE_SIZE,
+):
+    """
+    Рядки видачі проєкту по мірі готовності keywords, без Excel і історії:
+
+        async for row in stream_project(project_config):
+            row["Keyword"], row["Position"], row["Domain"], row["URL"], row["Is_Target"], row["Bucket"]
+
+    Черга обмежена (див. stream_keywords), тож повільний споживач
+    притримує запити. run_project — один зі споживачів цього потоку.
+    """
+    ctx = RunContext(project_config)
+    stream = stream_keywords(ctx, None, force_refresh, shared_store, runtime, queue_size)
+    try:
+        async for kw, keyword_data in stream:
+            if keyword_data is None:
+                print(f"\nВидачу для '{kw}' не отримано — пропускаю")
+                continue
+            for row in keyword_data:
+                yield row
+    finally:
+        await stream.aclose()
+
+
+# =========================
+# Етап звіту (у пулі процесів)
+# =========================
+def build_outputs(
+    project_config: dict,
+    journal_path: str,
+    run_id: str,
+    timestamp: str,
+    target_rows: list,
+    domain_interval_counts: dict,
+    domain_keywords: dict,
+) -> str:
+    """
+    Етап звіту run_project: історія, Excel / експорти, зведення і каталог.
+    Синхронна і з аргументами, що пікуються, — виконується в пулі процесів
+    SerpRuntime; рядки запуску читає з журналу за journal_path.
+    Повертає головний файл запуску.
+    """
+    ctx = RunContext(project_config, now=datetime.datetime.strptime(timestamp, "%Y-%m-%d %H:%M:%S"))
+    journal = RunJournal(journal_path, run_id)
+
+    # перезапуск після збою звіту: цей запуск уже міг потрапити в історію — він
+    # не "попередній" сам собі (add_run його замінить)
+    history = [
+        h for h in load_history(ctx.history_file, ctx.history_db, ctx.name) if h["timestamp"] != ctx.timestamp
+    ]
+    changes = diff_target_positions(history[-1]["results"] if history else None, target_rows)
+    save_history(ctx.history_file, journal.rows(), ctx.timestamp, ctx.history_db, ctx.name, changes)
+
+    domain_stats = build_domain_stats(
+        ctx, domain_interval_counts, domain_keywords, target_rows, domain_keyword_samples(journal.rows())
+    )
+    catalog = ReportCatalog()
+    try:
+        # звіти, зроблені до каталогу, — до запису нового, щоб він не потрапив у них
+        catalog.ensure_indexed(ctx.output_prefix, ctx.name)
+    except Exception as e:
+        print(f"Не вдалося проіндексувати старі звіти: {e}")
+    outputs = []
+    if "xlsx" in ctx.export_formats:
+        changes = load_changes(ctx.history_file, ctx.history_db)
+        outputs.append(write_report(ctx, journal.rows, target_rows, domain_stats, history, changes))
+    exported = export_tables(
+        ctx.export_formats,
+        ctx.output_base,
+        {
+            "results": (RESULT_COLUMNS, lambda: (result_record(ctx.name, r) for r in journal.rows())),
+            "domains": (
+                ["Domain", "Total"] + ctx.bucket_labels + ["Score", "Is_Target", "Keywords"],
+                lambda: iter(domain_stats),
+            ),
+        },
+    )
+    if exported:
+        print(f"Експорт: {', '.join(exported)}")
+    outputs += exported
+    summary = write_summary(ctx.output_base, build_run_summary(ctx, domain_stats))
+    try:
+        catalog.add(
+            ctx.output_prefix,
+            outputs[0] if outputs else summary,
+            ctx.timestamp,
+            files=outputs,
+            summary=summary,
+            project=ctx.name,
+            run_id=journal.run_id,
+        )
+    except Exception as e:
+        print(f"Не вдалося додати звіт у каталог: {e}")
+    finally:
+        catalog.close()
+    # головний файл запуску — Excel, якщо він увімкнений
+    return outputs[0] if outputs else ctx.output_file
+
+
+# =========================
+# Головна функція проєкту
+# =========================
+async def run_project(
+    project_config: dict,
+    progress_callback=None,
+    force_refresh: bool = False,
+    shared_store: SharedSerpStore = None,
+    runtime: SerpRuntime = None,
+) -> str:
+    """
+    project_config:
+      {
+        "name": "...",
+        "location": "...",
+        "gl": "...",
+        "hl": "...",
+        "api_keys": [...],
+        "target_domains": [...],
+        "keywords": [...],
+        "pages": 5,                 <-- ✅ тепер підтримується
+        "max_positions": 30,        <-- або як раніше
+        "fetch_mode": "deep",       <-- "paged" (дефолт) або "deep" (вся глибина за 1 запит)
+        "results_per_request": 100, <-- стеля num для "deep"
+        "pagination": "lazy",       <-- "eager" (дефолт) або "lazy" (глибше лише після повної сторінки)
+        "first_hit": true,          <-- lazy: не йти глибше, якщо таргет уже знайдено
+        "domain_level": "host",     <-- "host" (дефолт) або "registrable" (групувати по eTLD+1)
+        "batch_size": 10,           <-- >1: кілька запитів в одному POST
+        "cache_ttl": 3600,          <-- сек життя кешу SERP (0 — без кешу)
+        "workers": 12,              <-- розмір пулу воркерів конвеєра
+        "concurrency": {"initial": 3, "min": 1, "max": 12, "latency_target": 3.0},
+        "key_limits": {"requests_per_second": 5, "burst": 5},
+        "rate_limit": {"requests_per_second": 5, "jitter": 0.2},
+        "history_file": "...json",  <-- серія історії (старий JSON з цим ім'ям імпортується в базу)
+        "history_db": "serp_history.sqlite",
+        "output_prefix": "...",
+        "export_formats": ["xlsx", "parquet"],  <-- xlsx / csv / jsonl / parquet (дефолт — лише xlsx)
+        "checkpoint": true,         <-- відновлювати незавершений запуск з журналу (false — завжди заново)
+        "run_id": "..."             <-- id запуску для відновлення (дефолт — хеш налаштувань проєкту)
+      }
+
+    force_refresh=True — не брати відповіді з кешу (але оновити його).
+    shared_store — спільне сховище масового запуску (див. run_projects).
+    runtime — спільні сесія/лімітер/кеш кількох одночасних запусків;
+    без нього проєкт відкриває власні.
+    """
+    if runtime is None:
+        async with SerpRuntime(AdaptiveLimiter.from_config(project_config), shared_store) as own:
+            return await run_project(project_config, progress_callback, force_refresh, runtime=own)
+    if shared_store is None:
+        shared_store = runtime.shared_store
+
+    # незавершений запуск того самого проєкту — продовжуємо з журналу;
+    # журнал залочений на весь запуск, паралельний запуск візьме інший
+    journal = RunJournal.for_project(project_config)
+    try:
+        if project_config.get("checkpoint", True):
+            resumed = journal.load()
+        else:
+            journal.discard()
+            resumed = []
+
+        ctx = RunContext(project_config, now=journal.started)
+        keywords = ctx.keywords
+
+        print("-" * 90)
+        print(
+            f"Запуск: Serper.dev | ТОП-{ctx.max_positions} | Гео: {ctx.location} "
+            f"+ СУБДОМЕНИ + ПОВНА ІСТОРІЯ"
+        )
+        print(f"{ctx.timestamp}")
+        print(
+            f"Ключів API: {len(project_config['api_keys'])} "
+            f"| Таргет-доменів: {len(ctx.target_domains)}"
+        )
+        print(f"Ключових слів: {len(keywords)} | Вивід: {ctx.output_file}")
+        print(
+            f"Режим: {ctx.fetch_mode}/{ctx.pagination}{' first-hit' if ctx.first_hit else ''} | "
+            f"Запитів на ключ: до {len(ctx.request_plan)} (по {ctx.request_plan[0][1]} результатів)"
+        )
+        print(f"Бакети: {', '.join(ctx.bucket_labels)}")
+        print("-" * 90)
+
+        # рядки запуску живуть у журналі; у пам'яті — лише агрегати і таргетні рядки
+        found = 0
+        target_rows = []
+        domain_interval_counts = defaultdict(lambda: {label: 0 for label in ctx.bucket_labels})
+        domain_keywords = defaultdict(list)
+        total_kw = len(keywords)
+        done_kw = 0
+        failed = []               # keywords без видачі — у журнал не пишуться
+
+        def collect(keyword_data):
+            nonlocal done_kw, found
+            done_kw += 1
+            found += len(keyword_data)
+
+            for item in keyword_data:
+                d = item["Domain"]
+                b = item["Bucket"]
+                domain_interval_counts[d][b] += 1
+                if item["Is_Target"]:
+                    target_rows.append(item)
+                    domain_keywords[d].append({"keyword": item["Keyword"], "position": item["Position"]})
+
+        if resumed:
+            for _, keyword_data in journal.entries():
+                collect(keyword_data)
+            print(f"Відновлено з чекпойнту: {done_kw}/{total_kw} ключових слів ({journal.path})")
+            pending = Counter(keywords)
+            pending.subtract(resumed)
+            remaining = []
+            for kw in keywords:
+                if pending[kw] > 0:
+                    pending[kw] -= 1
+                    remaining.append(kw)
+            keywords = remaining
+        journal.open(ctx.timestamp)
+
+        try:
+            async for kw, keyword_data in stream_keywords(
+                ctx, keywords, force_refresh, shared_store, runtime
+            ):
+                if keyword_data is None:
+                    failed.append(kw)
+                    continue
+                journal.append(kw, keyword_data)
+                collect(keyword_data)
+
+                if progress_callback is not None:
+                    progress_callback(done_kw, total_kw, found)
+
+                print(
+                    f"\rОброблено: {done_kw}/{total_kw} | "
+                    f"Знайдено позицій: {found} | "
+                    f"Паралельність: {runtime.limiter.limit}",
+                    end="",
+                    flush=True,
+                )
+        finally:
+            journal.close()
+
+        print("\n")
+        if failed:
+            # неповний запуск не йде ні в звіт, ні в історію (таргети цих keywords
+            # виглядали б втраченими); журнал лишається — повторний запуск дозбирає
+            shown = ", ".join(failed[:5]) + (f" і ще {len(failed) - 5}" if len(failed) > 5 else "")
+            raise RuntimeError(
+                f"Не отримано видачу для {len(failed)}/{total_kw} ключових слів ({shown}). "
+                f"Звіт не збудовано, чекпойнт збережено — повторний запуск продовжить з нього."
+            )
+        # сюди доходимо лише з повним журналом: історія і звіт — один раз на запуск,
+        # в окремому процесі (див. build_outputs), щоб цикл подій не блокувався
+        output_file = await runtime.build_report(
+            build_outputs,
+            project_config,
+            str(journal.path),
+            journal.run_id,
+            ctx.timestamp,
+            target_rows,
+            {d: dict(stats) for d, stats in domain_interval_counts.items()},
+            dict(domain_keywords),
+        )
+        journal.discard()
+        return output_file
+    finally:
+        journal.release()
+
+
+async def run_projects(
+    project_configs: list,
+    progress_callback=None,
+    force_refresh: bool = False,
+    concurrent: bool = True,
+) -> list:
+    """
+    Масовий запуск кількох проєктів зі спільною дедуплікацією запитів:
+    однакова видача (keyword, гео, сторінка, num) запитується один раз
+    і розходиться по проєктах, кожен оцінює її за своїми таргетами
+    і пише свій звіт.
+
+    concurrent=True — проєкти йдуть одночасно через спільний SerpRuntime
+    (слоти лімітера діляться між ними по колу), тож час масового запуску
+    ≈ час найдовшого проєкту, а не сума.
+
+    progress_callback(project_name, done, total, found).
+    Повертає список шляхів до звітів у порядку project_configs.
+    """
+    store = SharedSerpStore.for_projects(project_configs)
+
+    def make_callback(name):
+        if progress_callback is None:
+            return None
+
+        def callback(done, total, found):
+            progress_callback(name, done, total, found)
+
+        return callback
+
+    async with SerpRuntime.for_projects(project_configs, shared_store=store) as runtime:
+        def run(cfg):
+            return run_project(cfg, make_callback(cfg["name"]), force_refresh=force_refresh, runtime=runtime)
+
+        if concurrent:
+            outputs = list(await asyncio.gather(*(run(cfg) for cfg in project_configs)))
+        else:
+            outputs = []
+            for cfg in project_configs:
+                outputs.append(await run(cfg))
+    print(f"Дедуплікація: заощаджено {store.saved} запитів")
+    return outputs
@@ -0,0 +1,86 @@
+from functools import lru_cache
+from pathlib import Path
+
+# =========================
+# Public Suffix List (офлайн)
+# =========================
+# Копія https://publicsuffix.org/list/public_suffix_list.dat лежить поруч
+# з модулем; оновлюється простою заміною файлу.
+PUBLIC_SUFFIX_FILE = Path(__file__).with_name("public_suffix_list.dat")
+
+
+class PublicSuffixList:
+    """
+    Правила PSL у трьох множинах: звичайні (co.uk), wildcard (*.ck —
+    зберігається як "ck") і винятки (!www.ck). Публічний суфікс хоста —
+    найдовше правило, що підходить; виняток переважає, а якщо не підійшло
+    нічого — суфіксом вважається остання мітка (правило "*").
+    """
+
+    def __init__(self, rules):
+        self.exact = set()
+        self.wildcard = set()
+        self.exceptions = set()
+        for rule in rules:
+            if rule.startswith("!"):
+                self.exceptions.add(rule[1:])
+            elif rule.startswith("*."):
+                self.wildcard.add(rule[2:])
+            else:
+                self.exact.add(rule)
+
+    @classmethod
+    def from_file(cls, path=PUBLIC_SUFFIX_FILE) -> "PublicSuffixList":
+        rules = []
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line or line.startswith("//"):
+                    continue
+                rule = line.split()[0].lower()
+                if not rule.isascii():
+                    # IDN-правила приводимо до punycode, як хости в URL
+                    try:
+                        rule = rule.encode("idna").decode("ascii")
+                    except UnicodeError:
+                        continue
+                rules.append(rule)
+        return cls(rules)
+
+    def suffix_length(self, labels: list) -> int:
+        """Скільки останніх міток хоста складають публічний суфікс."""
+        n = len(labels)
+        for i in range(n):
+            candidate = ".".join(labels[i:])
+            if candidate in self.exceptions:
+                return n - i - 1
+            if candidate in self.exact:
+                return n - i
+            if i + 1 < n and ".".join(labels[i + 1:]) in self.wildcard:
+                return n - i
+        return 1
+
+    def registrable_domain(self, host: str) -> str:
+        """
+        eTLD+1: fr.example.co.uk -> example.co.uk, a.b.example.fr -> example.fr.
+        Хост, що сам є публічним суфіксом (або IP), повертається як є.
+        """
+        host = host.strip(".").lower()
+        if not host or host.replace(".", "").isdigit():
+            return host
+        labels = host.split(".")
+        keep = self.suffix_length(labels) + 1
+        if keep > len(labels):
+            return host
+        return ".".join(labels[-keep:])
+
+
+@lru_cache(maxsize=1)
+def default_list() -> PublicSuffixList:
+    """Вбудований список; читається один раз на процес, при першому зверненні."""
+    return PublicSuffixList.from_file()
+
+
+@lru_cache(maxsize=65536)
+def registrable_domain(host: str) -> str:
+    return default_list().registrable_domain(host)
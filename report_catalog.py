@@ -0,0 +1,153 @@
+import datetime
+import json
+import os
+import re
+import sqlite3
+import time
+from pathlib import Path
+
+from exporters import SUMMARY_SUFFIX
+
+# =========================
+# Налаштування каталогу звітів
+# =========================
+REPORT_CATALOG = "report_catalog.sqlite"
+
+
+class ReportCatalog:
+    """
+    Каталог готових звітів (SQLite): по рядку на запуск —
+    проєкт, output_prefix, run id, основний файл, усі файли запуску
+    (xlsx, експорти, .summary.json), час і розмір.
+
+    Бот шукає останній / попередній звіт і чистить старі за каталогом,
+    а не обходом робочої теки (rglob + stat кожного xlsx); ретеншн
+    зачіпає лише записи одного prefix.
+    """
+
+    def __init__(self, path: str = REPORT_CATALOG):
+        self.path = path
+        self.conn = sqlite3.connect(path, timeout=30)
+        self.conn.executescript(
+            "CREATE TABLE IF NOT EXISTS reports ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+            " project TEXT NOT NULL DEFAULT '',"
+            " prefix TEXT NOT NULL,"
+            " run_id TEXT NOT NULL DEFAULT '',"
+            " path TEXT NOT NULL,"
+            " files TEXT NOT NULL,"
+            " summary TEXT,"
+            " timestamp TEXT NOT NULL,"
+            " size INTEGER NOT NULL DEFAULT 0,"
+            " created REAL NOT NULL);"
+            "CREATE INDEX IF NOT EXISTS idx_reports_prefix ON reports(prefix, timestamp);"
+            "CREATE TABLE IF NOT EXISTS indexed ("
+            " prefix TEXT PRIMARY KEY,"
+            " indexed REAL NOT NULL);"
+        )
+        self.conn.commit()
+
+    def add(self, prefix: str, path: str, timestamp: str, files=(), summary: str = None,
+            project: str = "", run_id: str = "") -> int:
+        """
+        Реєструє запуск; path — основний файл (xlsx або перший експорт).
+        Запуск у ту саму хвилину перезаписує файли попереднього — його запис
+        замінюється.
+        """
+        files = list(dict.fromkeys([path, *files] + ([summary] if summary else [])))
+        size = 0
+        for f in files:
+            try:
+                size += os.path.getsize(f)
+            except OSError:
+                pass
+        with self.conn:
+            self.conn.execute("DELETE FROM reports WHERE prefix = ? AND path = ?", (prefix, str(path)))
+            cur = self.conn.execute(
+                "INSERT INTO reports (project, prefix, run_id, path, files, summary, timestamp, size, created) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (project, prefix, run_id, str(path), json.dumps(files, ensure_ascii=False),
+                 summary, timestamp, size, time.time()),
+            )
+        return cur.lastrowid
+
+    def reports(self, prefix: str, limit: int = None) -> list:
+        """Записи prefix від новіших до старших: [{"id", "path", "summary", "timestamp", ...}]."""
+        sql = (
+            "SELECT id, project, run_id, path, files, summary, timestamp, size, created FROM reports "
+            "WHERE prefix = ? ORDER BY timestamp DESC, id DESC"
+        )
+        params = [prefix]
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(int(limit))
+        out = []
+        for rid, project, run_id, path, files, summary, timestamp, size, created in self.conn.execute(sql, params):
+            out.append({
+                "id": rid,
+                "project": project,
+                "run_id": run_id,
+                "path": path,
+                "files": json.loads(files),
+                "summary": summary,
+                "timestamp": timestamp,
+                "size": size,
+                "created": created,
+            })
+        return out
+
+    def latest(self, prefix: str):
+        found = self.reports(prefix, limit=1)
+        return found[0] if found else None
+
+    def prune(self, prefix: str, keep_last: int = 2) -> list:
+        """Видаляє файли і записи всіх запусків prefix, крім keep_last новіших; повертає видалені шляхи."""
+        removed = []
+        entries = self.reports(prefix)
+        old = entries[keep_last:]
+        kept = {f for entry in entries[:keep_last] for f in entry["files"]}
+        for entry in old:
+            for f in entry["files"]:
+                if f in kept:
+                    continue
+                try:
+                    os.remove(f)
+                    removed.append(f)
+                except FileNotFoundError:
+                    pass
+                except OSError as e:
+                    print(f"Не вдалося видалити {f}: {e}")
+        if old:
+            with self.conn:
+                self.conn.executemany("DELETE FROM reports WHERE id = ?", [(e["id"],) for e in old])
+        return removed
+
+    def ensure_indexed(self, prefix: str, project: str = ""):
+        """
+        Одноразово додає в каталог звіти prefix, зроблені до появи каталогу
+        (<prefix>_YYYYmmdd_HHMM.xlsx поруч із prefix), щоб з ними працювали
+        порівняння і ретеншн.
+        """
+        if self.conn.execute("SELECT 1 FROM indexed WHERE prefix = ?", (prefix,)).fetchone():
+            return
+        base = Path(prefix)
+        pattern = re.compile(re.escape(base.name) + r"_(\d{8}_\d{4})\.xlsx$")
+        known = {entry["path"] for entry in self.reports(prefix)}
+        folder = base.parent
+        for p in sorted(folder.glob(f"{base.name}_*.xlsx")) if folder.is_dir() else []:
+            m = pattern.match(p.name)
+            if not m or str(p) in known:
+                continue
+            timestamp = datetime.datetime.strptime(m.group(1), "%Y%m%d_%H%M").strftime("%Y-%m-%d %H:%M:%S")
+            summary = p.with_name(f"{base.name}_{m.group(1)}{SUMMARY_SUFFIX}")
+            self.add(prefix, str(p), timestamp, summary=str(summary) if summary.exists() else None, project=project)
+        with self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO indexed (prefix, indexed) VALUES (?, ?)", (prefix, time.time())
+            )
+
+    def close(self):
+        try:
+            self.conn.close()
+        except Exception:
+            pass
@@ -0,0 +1,230 @@
+import datetime
+import hashlib
+import json
+import os
+import time
+import uuid
+from pathlib import Path
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+# =========================
+# Налаштування чекпойнтів
+# =========================
+CHECKPOINT_DIR = "checkpoints"
+CHECKPOINT_MAX_AGE = 3 * 3600      # сек; старіший незавершений журнал не відновлюємо, а починаємо заново
+
+# поля конфігу, що визначають видачу; інші (ключі, темп, воркери) на run id не впливають
+RUN_ID_FIELDS = (
+    "name", "location", "gl", "hl", "pages", "max_positions", "fetch_mode",
+    "results_per_request", "pagination", "first_hit", "domain_level",
+)
+
+
+def make_run_id(project_config: dict) -> str:
+    """
+    Run id проєкту: явний project_config["run_id"] або sha1 від налаштувань
+    видачі, keywords і таргетів — тож повторний запуск того самого проєкту
+    після падіння знаходить свій журнал.
+    """
+    if project_config.get("run_id"):
+        return str(project_config["run_id"])
+    raw = json.dumps(
+        [
+            [project_config.get(f) for f in RUN_ID_FIELDS],
+            sorted(k.strip() for k in project_config.get("keywords", []) if k.strip()),
+            sorted(project_config.get("target_domains", [])),
+        ],
+        ensure_ascii=False,
+        sort_keys=True,
+    )
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()[:16]
+
+
+def try_lock(f) -> bool:
+    """Неблокуючий ексклюзивний лок на відкритий файл; False — його тримає інший запуск."""
+    try:
+        if fcntl is not None:
+            # flock — на відкритий файл, тож конфліктують і два запуски в одному процесі
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        else:
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+    except OSError:
+        return False
+    return True
+
+
+class RunJournal:
+    """
+    Append-only журнал запуску (JSONL): перший рядок — заголовок
+    {"run_id", "timestamp"}, далі по рядку на кожен готовий keyword
+    {"keyword", "rows"}. Рядок дописується і скидається на диск одразу,
+    тож після падіння процесу втрачається щонайбільше недописаний
+    останній рядок.
+
+    Журнал — це й сховище рядків запуску: у пам'яті їх не тримаємо,
+    звіт та історія читають їх звідси потоково (rows()).
+
+    При повторному запуску з тим самим run id (і журнал не старший за
+    max_age) вже отримані keywords не запитуються вдруге, а агрегати
+    відновлюються з журналу. Після успішного звіту журнал видаляється.
+
+    Журнал пише лише один запуск: на весь запуск тримається
+    ексклюзивний лок (<журнал>.lock). Запуск того самого проєкту, що
+    перетнувся з поточним (ручний + авто, двічі поставлена задача),
+    не чіпає чужий журнал, а бере вільний сусідній шлях.
+    """
+
+    def __init__(self, path, run_id: str, max_age: float = CHECKPOINT_MAX_AGE):
+        self.path = Path(path)
+        self.run_id = run_id
+        self.max_age = max_age
+        self.started = None        # datetime початку запуску (з заголовка журналу)
+        self._valid_size = 0       # байтів у журналі до першого битого рядка
+        self._f = None
+        self._lock = None
+
+    @classmethod
+    def for_project(cls, project_config: dict, directory: str = CHECKPOINT_DIR) -> "RunJournal":
+        """
+        Журнал проєкту, уже залочений цим запуском (звільнити — release()).
+        Спершу — вільні журнали, що лишились після падіння (їх можна
+        відновити), далі основний шлях; якщо всі зайняті іншими
+        запусками — новий <name>_<run_id>.<id>.jsonl.
+        """
+        run_id = make_run_id(project_config)
+        name = "".join(c if c.isalnum() else "_" for c in project_config.get("name", "run"))
+        main = Path(directory) / f"{name}_{run_id}.jsonl"
+        candidates = [main] if main.exists() else []
+        if main.parent.is_dir():
+            candidates += sorted(main.parent.glob(f"{name}_{run_id}.*.jsonl"))
+        candidates.append(main)
+        for path in dict.fromkeys(candidates):
+            journal = cls(path, run_id)
+            if journal.lock():
+                return journal
+        journal = cls(main.with_name(f"{name}_{run_id}.{uuid.uuid4().hex[:8]}.jsonl"), run_id)
+        if not journal.lock():
+            raise RuntimeError(f"Не вдалося залочити журнал {journal.path}")
+        return journal
+
+    def lock(self) -> bool:
+        """Захоплює журнал для цього запуску; False — його вже пише інший запуск."""
+        lock_path = self.path.with_name(self.path.name + ".lock")
+        lock_path.parent.mkdir(parents=True, exist_ok=True)
+        while True:
+            f = open(lock_path, "a+b")
+            if not try_lock(f):
+                f.close()
+                return False
+            # лок-файл міг бути видалений попереднім власником між open і lock —
+            # тоді лок на вже відв'язаному файлі нічого не захищає, пробуємо ще раз
+            try:
+                same = os.fstat(f.fileno()).st_ino == os.stat(lock_path).st_ino
+            except FileNotFoundError:
+                same = False
+            if same:
+                self._lock = f
+                return True
+            f.close()
+
+    def release(self):
+        """Закриває журнал і звільняє лок (сам журнал лишається, якщо не discard())."""
+        self.close()
+        if self._lock is None:
+            return
+        try:
+            # видаляємо, ще тримаючи лок (на Windows відкритий файл не видаляється — лишиться)
+            os.remove(self._lock.name)
+        except OSError:
+            pass
+        self._lock.close()
+        self._lock = None
+
+    def load(self) -> list:
+        """
+        Перевіряє журнал попереднього незавершеного запуску.
+        Повертає список уже готових keywords і запам'ятовує self.started
+        (самі рядки — через entries()); застарілий або чужий журнал
+        видаляється — тоді [].
+        """
+        if not self.path.exists():
+            return []
+        done = []
+        try:
+            with open(self.path, "rb") as f:
+                header = json.loads(f.readline() or b"{}")
+                started = header.get("timestamp")
+                if header.get("run_id") != self.run_id or not started:
+                    raise ValueError("чужий журнал")
+                self.started = datetime.datetime.strptime(started, "%Y-%m-%d %H:%M:%S")
+                if time.time() - self.started.timestamp() > self.max_age:
+                    raise ValueError("застарілий журнал")
+                self._valid_size = f.tell()
+                for line in f:
+                    if not line.endswith(b"\n"):
+                        break  # недописаний рядок на момент падіння
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        break
+                    done.append(entry["keyword"])
+                    self._valid_size += len(line)
+        except Exception as e:
+            print(f"Чекпойнт {self.path} не відновлено ({e}) — починаємо заново")
+            self.started = None
+            self.discard()
+            return []
+        return done
+
+    def open(self, timestamp: str):
+        """Відкриває журнал на дозапис; новий журнал починається із заголовка."""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        if self.started is None:
+            self._f = open(self.path, "w", encoding="utf-8")
+            self._write({"run_id": self.run_id, "timestamp": timestamp})
+            return
+        # відрізаємо недописаний хвіст, щоб нові рядки не злиплися з ним
+        with open(self.path, "r+b") as f:
+            f.truncate(self._valid_size)
+        self._f = open(self.path, "a", encoding="utf-8")
+
+    def entries(self):
+        """Генератор (keyword, rows) з журналу — по одному keyword у пам'яті."""
+        with open(self.path, "rb") as f:
+            f.readline()  # заголовок
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break
+                entry = json.loads(line)
+                yield entry["keyword"], entry["rows"]
+
+    def rows(self):
+        """Генератор усіх рядків запуску в порядку завершення keywords."""
+        for _, rows in self.entries():
+            yield from rows
+
+    def append(self, keyword: str, rows: list):
+        self._write({"keyword": keyword, "rows": rows})
+
+    def _write(self, entry: dict):
+        self._f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        self._f.flush()
+
+    def close(self):
+        if self._f is not None:
+            self._f.close()
+            self._f = None
+
+    def discard(self):
+        """Закриває і видаляє журнал (запуск завершено або журнал непридатний)."""
+        self.close()
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
@@ -20,7 +20,10 @@ from telegram.ext import (
 )
 from openpyxl import load_workbook
 
-from parser_core import run_project  # НЕ чіпаємо parser_core.py
+from exporters import read_summary
+from parser_core import run_project, SharedSerpStore, SerpRuntime
+from report_catalog import ReportCatalog
+from telegram_broadcast import Broadcaster
 
 # =========================
 # НАЛАШТУВАННЯ
@@ -29,7 +32,6 @@ TELEGRAM_BOT_TOKEN = "8146349890:AAGvkkJnglQfQak0yRxX3JMGZ3zzbKSU-Eo"
 PROJECTS_FILE = "projects.json"
 USERS_FILE = "users.txt"
 ADMIN_FILE = "admin_chat_id.txt"
-LAST_HISTORY_DIR = "last_history"
 LOCK_FILE = "/tmp/telegram_bot.lock"
 
 DEFAULT_ADMIN_CHAT_ID = 909587225
@@ -157,28 +159,25 @@ async def _safe_send_document(bot, chat_id: int, path: Path, caption: str) -> bo
         logger.warning("send_document failed for %s: %s", chat_id, e)
         return False
 
+def get_broadcaster(context: ContextTypes.DEFAULT_TYPE) -> Broadcaster:
+    """Один Broadcaster на бота — ліміти Telegram спільні для всіх розсилок."""
+    if "broadcaster" not in context.bot_data:
+        context.bot_data["broadcaster"] = Broadcaster(context.bot)
+    return context.bot_data["broadcaster"]
+
 # =========================
-# XLSX HELPERS
+# ЗВІТИ (каталог report_catalog)
 # =========================
-def find_latest_xlsx(since_ts: float) -> Optional[Path]:
-    latest = None
-    latest_mtime = 0.0
-    for p in Path(".").rglob("*.xlsx"):
-        try:
-            m = p.stat().st_mtime
-            if m >= since_ts and m >= latest_mtime:
-                latest = p
-                latest_mtime = m
-        except Exception:
-            continue
-    return latest
-
-def find_previous_report(output_prefix: str, current_path: Path) -> Optional[Path]:
-    candidates = [p for p in Path(".").rglob(f"{output_prefix}_*.xlsx") if p.resolve() != current_path.resolve()]
-    if not candidates:
-        return None
-    candidates.sort(key=lambda x: x.stat().st_mtime, reverse=True)
-    return candidates[0]
+def latest_report(output_prefix: str, since_ts: float = 0.0) -> Optional[Path]:
+    """Основний файл останнього запуску prefix з каталогу, якщо він не старший за since_ts."""
+    catalog = ReportCatalog()
+    try:
+        entry = catalog.latest(output_prefix)
+    finally:
+        catalog.close()
+    if entry and entry["created"] >= since_ts:
+        return Path(entry["path"])
+    return None
 
 def read_target_domain_stats(xlsx_path: Path) -> Dict[str, float]:
     wb = load_workbook(xlsx_path, read_only=True, data_only=True)
@@ -212,6 +211,42 @@ def read_target_domain_stats(xlsx_path: Path) -> Dict[str, float]:
         out[domain] = float(kw_count)
     return out
 
+def read_summary_stats(path: Path) -> Dict[str, float]:
+    """Те саме, що read_target_domain_stats, але з .summary.json запуску."""
+    targets = read_summary(path).get("targets", {})
+    return {domain: float(t["keywords"]) for domain, t in targets.items()}
+
+def report_stats(entry: dict) -> Optional[Dict[str, float]]:
+    """Статистика target-доменів запуску з каталогу: зі зведення, для старих звітів — з xlsx."""
+    if entry["summary"] and Path(entry["summary"]).exists():
+        return read_summary_stats(Path(entry["summary"]))
+    path = Path(entry["path"])
+    if path.suffix == ".xlsx" and path.exists():
+        return read_target_domain_stats(path)
+    return None
+
+def project_delta_message(output_prefix: str, name: str = "") -> Optional[str]:
+    """
+    Дельта target-доменів останнього запуску vs попередній — один раз
+    на проєкт, за двома останніми записами каталогу звітів. name — у
+    заголовок: проєкти йдуть одночасно і їхні повідомлення перемежовуються.
+    None — порівнювати немає з чим.
+    """
+    catalog = ReportCatalog()
+    try:
+        entries = catalog.reports(output_prefix, limit=2)
+        if len(entries) < 2:
+            return None
+        cur_stats, prev_stats = report_stats(entries[0]), report_stats(entries[1])
+        if cur_stats is None or prev_stats is None:
+            return None
+        return format_delta_report(prev_stats, cur_stats, name=name)
+    except Exception as e:
+        logger.warning("delta failed for %s: %s", output_prefix, e)
+        return None
+    finally:
+        catalog.close()
+
 def _badge(prev: float, now: float) -> str:
     if prev == 0 and now > 0:
         return "🟢"
@@ -225,7 +260,15 @@ def _badge(prev: float, now: float) -> str:
         return "🔻"
     return "⚪"
 
-def format_delta_report(prev_map: Dict[str, float], cur_map: Dict[str, float], top_n: int = 30) -> str:
+def _md_escape(text: str) -> str:
+    # службові символи legacy Markdown (parse_mode="Markdown")
+    for ch in ("_", "*", "`", "["):
+        text = text.replace(ch, "\\" + ch)
+    return text
+
+def format_delta_report(
+    prev_map: Dict[str, float], cur_map: Dict[str, float], top_n: int = 30, name: str = ""
+) -> str:
     domains = sorted(set(prev_map.keys()) | set(cur_map.keys()))
     
     rows: List[Tuple[float, float, str, float, float]] = []
@@ -258,7 +301,8 @@ def format_delta_report(prev_map: Dict[str, float], cur_map: Dict[str, float], t
 
     lines = []
     lines.append(
-        f"📊 *Динаміка Keywords vs попередній парсинг* (топ {len(rows)} доменів)\n"
+        f"📊 {f'«{_md_escape(name)}» — ' if name else ''}*Динаміка Keywords vs попередній парсинг* "
+        f"(топ {len(rows)} доменів)\n"
         f"🟢 Зростання: {summary['kw_up']}  🔻 Падіння: {summary['kw_down']} (🟥 сильне: {summary['kw_severe']})\n"
         f"NEW: {summary['kw_new']}  LOST: {summary['kw_lost']}  ⚪ Без змін: {summary['kw_same']}\n"
     )
@@ -279,48 +323,15 @@ def format_delta_report(prev_map: Dict[str, float], cur_map: Dict[str, float], t
     lines.append("```")
     return "\n".join(lines)
 
-def add_history_sheet_if_needed(xlsx_path: Path, project_name: str):
-    Path(LAST_HISTORY_DIR).mkdir(exist_ok=True)
-    history_path = Path(LAST_HISTORY_DIR) / f"{project_name}.json"
-    try:
-        wb = load_workbook(xlsx_path, read_only=False)
-        data_to_save = {}
-        for sheet_name in wb.sheetnames:
-            ws = wb[sheet_name]
-            data = [[cell.value for cell in row] for row in ws.iter_rows()]
-            data_to_save[sheet_name] = data
-        history_path.write_text(json.dumps(data_to_save, ensure_ascii=False, indent=2), encoding="utf-8")
-
-        prev_reports = list(Path(".").rglob(f"*_{project_name}_*.xlsx"))
-        if len(prev_reports) > 1 or (history_path.exists() and history_path.stat().st_size > 10):
-            if "History" in wb.sheetnames:
-                wb.remove(wb["History"])
-            history_ws = wb.create_sheet("History")
-            if history_path.exists():
-                old_data = json.loads(history_path.read_text(encoding="utf-8"))
-                for sheet_name, rows in old_data.items():
-                    history_ws.append([f"=== Попередній парсинг: {sheet_name} ==="])
-                    for row in rows:
-                        history_ws.append(row)
-                    history_ws.append([])
-        wb.save(xlsx_path)
-    except Exception as e:
-        logger.error(f"Помилка додавання історії для {project_name}: {e}")
-
 def cleanup_old_reports(output_prefix: str, keep_last: int = 2):
+    catalog = ReportCatalog()
     try:
-        files = list(Path(".").rglob(f"{output_prefix}_*.xlsx"))
-        if len(files) <= keep_last:
-            return
-        files.sort(key=lambda x: x.stat().st_mtime, reverse=True)
-        for old_file in files[keep_last:]:
-            try:
-                old_file.unlink()
-                logger.info(f"Видалено старий файл: {old_file.name}")
-            except Exception as e:
-                logger.warning(f"Не вдалося видалити {old_file.name}: {e}")
+        for old_file in catalog.prune(output_prefix, keep_last):
+            logger.info(f"Видалено старий файл: {old_file}")
     except Exception as e:
         logger.error(f"Помилка при очищенні файлів: {e}")
+    finally:
+        catalog.close()
 
 # =========================
 # КЛАВІАТУРИ
@@ -399,50 +410,58 @@ async def callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
         async def runner():
             try:
-                for i, name in enumerate(st["projects"], 1):
-                    reload_projects()
+                # конфіги всіх вибраних проєктів наперед — щоб спільні запити
+                # (той самий keyword у тому ж гео) робились один раз
+                reload_projects()
+                cfgs = {}
+                for name in st["projects"]:
                     project = PROJECTS_BY_NAME.get(name)
-                    if not project:
+                    if project:
+                        cfg = dict(project)
+                        cfg["max_positions"] = top_n
+                        cfgs[name] = cfg
+                    else:
                         await _safe_send_message(context.bot, chat_id, f"⚠️ Проєкт «{name}» не знайдено.")
-                        continue
-                    cfg = dict(project)
-                    cfg["max_positions"] = top_n
+                shared_store = SharedSerpStore.for_projects(list(cfgs.values()))
+
+                async def run_one(i, name, cfg, runtime):
                     output_prefix = cfg.get("output_prefix", "report")
 
-                    await _safe_send_message(context.bot, chat_id, f"▶️ [{i}/{len(st['projects'])}] Парсю «{name}»")
+                    await _safe_send_message(context.bot, chat_id, f"▶️ [{i}/{len(cfgs)}] Парсю «{name}»")
                     start_ts = datetime.now().timestamp()
 
                     try:
-                        out_path = await run_project(cfg)
+                        out_path = await run_project(cfg, runtime=runtime)
                     except Exception as e:
                         await _safe_send_message(context.bot, chat_id, f"🚨 Помилка в «{name}»: {e}")
                         await send_error_to_admin(context, f"Помилка в «{name}»: {e}")
-                        continue
+                        return
 
-                    xlsx_path = None
+                    report_path = None
                     if isinstance(out_path, str):
                         p = Path(out_path)
                         if p.exists():
-                            xlsx_path = p
-                    if not xlsx_path:
-                        xlsx_path = find_latest_xlsx(start_ts)
-
-                    if xlsx_path and xlsx_path.exists():
-                        add_history_sheet_if_needed(xlsx_path, name)
-                        cleanup_old_reports(output_prefix)  # Залишаємо тільки 2 файли
+                            report_path = p
+                    if not report_path:
+                        report_path = latest_report(output_prefix, start_ts)
+
+                    if report_path and report_path.exists():
+                        # читання зведень і видалення файлів — поза циклом подій
+                        delta_msg = await asyncio.to_thread(project_delta_message, output_prefix, name)
+                        await asyncio.to_thread(cleanup_old_reports, output_prefix)  # Залишаємо тільки 2 файли
                         await _safe_send_message(context.bot, chat_id, f"✅ «{name}» готово")
-                        await _safe_send_document(context.bot, chat_id, xlsx_path, caption=xlsx_path.name)
-
-                        prev_xlsx = find_previous_report(output_prefix, xlsx_path)
-                        if prev_xlsx and prev_xlsx.exists():
-                            prev_stats = read_target_domain_stats(prev_xlsx)
-                            cur_stats = read_target_domain_stats(xlsx_path)
-                            msg = format_delta_report(prev_stats, cur_stats)
-                            await _safe_send_message(context.bot, chat_id, msg)
-                        else:
-                            await _safe_send_message(context.bot, chat_id, "ℹ️ Перший звіт — порівняння немає.")
+                        await _safe_send_document(context.bot, chat_id, report_path, caption=report_path.name)
+                        await _safe_send_message(
+                            context.bot, chat_id, delta_msg or f"ℹ️ «{name}»: перший звіт — порівняння немає."
+                        )
                     else:
                         await _safe_send_message(context.bot, chat_id, "✅ Виконано, але файл не знайдено.")
+
+                # проєкти парсяться одночасно, слоти запитів діляться між ними по колу
+                async with SerpRuntime.for_projects(list(cfgs.values()), shared_store=shared_store) as runtime:
+                    await asyncio.gather(
+                        *(run_one(i, name, cfg, runtime) for i, (name, cfg) in enumerate(cfgs.items(), 1))
+                    )
                 await _safe_send_message(context.bot, chat_id, "🏁 Ручний парсинг завершено.")
             except Exception as e:
                 await send_error_to_admin(context, f"runner error: {e}")
@@ -553,63 +572,63 @@ async def auto_parsing_task(context: ContextTypes.DEFAULT_TYPE):
         users = load_users()
         if not users:
             return
+        # розсилка всім підписникам паралельно, у межах лімітів Telegram
+        broadcaster = get_broadcaster(context)
         reload_projects()
         if not PROJECTS:
-            for uid in users:
-                await _safe_send_message(context.bot, uid, "⚠️ Немає проєктів")
+            await broadcaster.broadcast_message(users, "⚠️ Немає проєктів")
             return
 
-        for uid in users:
-            await _safe_send_message(context.bot, uid, f"🤖 Автопарсинг стартував ({len(PROJECTS)} проєктів, TOP-30)")
+        await broadcaster.broadcast_message(users, f"🤖 Автопарсинг стартував ({len(PROJECTS)} проєктів, TOP-30)")
 
-        for i, project in enumerate(PROJECTS, 1):
-            name = project.get("name", "Unnamed")
+        cfgs = []
+        for project in PROJECTS:
             cfg = dict(project)
             cfg["max_positions"] = 30
+            cfgs.append(cfg)
+        shared_store = SharedSerpStore.for_projects(cfgs)
+
+        async def run_one(i, cfg, runtime):
+            name = cfg.get("name", "Unnamed")
             output_prefix = cfg.get("output_prefix", "report")
 
-            for uid in users:
-                await _safe_send_message(context.bot, uid, f"▶️ [{i}/{len(PROJECTS)}] Парсю «{name}»")
+            await broadcaster.broadcast_message(users, f"▶️ [{i}/{len(PROJECTS)}] Парсю «{name}»")
 
             start_ts = datetime.now().timestamp()
             try:
-                out_path = await run_project(cfg)
+                out_path = await run_project(cfg, runtime=runtime)
             except Exception as e:
                 msg = f"🚨 Помилка в «{name}»: {e}"
-                for uid in users:
-                    await _safe_send_message(context.bot, uid, msg)
+                await broadcaster.broadcast_message(users, msg)
                 await send_error_to_admin(context, msg)
-                continue
+                return
 
-            xlsx_path = None
+            report_path = None
             if isinstance(out_path, str):
                 p = Path(out_path)
                 if p.exists():
-                    xlsx_path = p
-            if not xlsx_path:
-                xlsx_path = find_latest_xlsx(start_ts)
-
-            if xlsx_path and xlsx_path.exists():
-                add_history_sheet_if_needed(xlsx_path, name)
-                cleanup_old_reports(output_prefix)  # Залишаємо тільки 2 файли
-                for uid in users:
-                    await _safe_send_message(context.bot, uid, f"✅ «{name}» готово")
-                    await _safe_send_document(context.bot, uid, xlsx_path, caption=f"AUTO {xlsx_path.name}")
-
-                    prev_xlsx = find_previous_report(output_prefix, xlsx_path)
-                    if prev_xlsx and prev_xlsx.exists():
-                        prev_stats = read_target_domain_stats(prev_xlsx)
-                        cur_stats = read_target_domain_stats(xlsx_path)
-                        msg = format_delta_report(prev_stats, cur_stats)
-                        await _safe_send_message(context.bot, uid, msg)
-                    else:
-                        await _safe_send_message(context.bot, uid, "ℹ️ Перший автозвіт — порівняння немає.")
+                    report_path = p
+            if not report_path:
+                report_path = latest_report(output_prefix, start_ts)
+
+            if report_path and report_path.exists():
+                # дельта рахується один раз на проєкт, а не для кожного підписника
+                delta_msg = await asyncio.to_thread(project_delta_message, output_prefix, name)
+                await asyncio.to_thread(cleanup_old_reports, output_prefix)  # Залишаємо тільки 2 файли
+                await broadcaster.broadcast_message(users, f"✅ «{name}» готово")
+                # файл вантажиться один раз, решта підписників отримує його за file_id
+                await broadcaster.broadcast_document(users, report_path, caption=f"AUTO {report_path.name}")
+                await broadcaster.broadcast_message(
+                    users, delta_msg or f"ℹ️ «{name}»: перший автозвіт — порівняння немає."
+                )
             else:
-                for uid in users:
-                    await _safe_send_message(context.bot, uid, f"✅ «{name}» виконано, файл не знайдено.")
+                await broadcaster.broadcast_message(users, f"✅ «{name}» виконано, файл не знайдено.")
+
+        # усі проєкти одночасно: час автопарсингу ≈ час найдовшого проєкту
+        async with SerpRuntime.for_projects(cfgs, shared_store=shared_store) as runtime:
+            await asyncio.gather(*(run_one(i, cfg, runtime) for i, cfg in enumerate(cfgs, 1)))
 
-        for uid in users:
-            await _safe_send_message(context.bot, uid, "🏁 Автопарсинг завершено.")
+        await broadcaster.broadcast_message(users, "🏁 Автопарсинг завершено.")
 
 # =========================
 # MAIN
@@ -0,0 +1,145 @@
+import hashlib
+import json
+import sqlite3
+import time
+
+# =========================
+# Налаштування кешу
+# =========================
+CACHE_FILE = "serp_cache.sqlite"
+CACHE_MAX_MB = 200                 # стеля розміру кешу; далі — LRU-витіснення
+CACHE_TOUCH_BATCH = 200            # влучань, після яких час доступу (LRU) пишеться на диск
+
+
+def normalize_request(q: str, location: str, gl: str, hl: str, page: int, num: int) -> tuple:
+    """
+    Нормалізований запит до Serper: регістр і пробіли в q та гео не
+    змінюють видачу, тож "Kw " і "kw" — той самий запит і в кеші,
+    і в дедуплікації масового запуску.
+    """
+    return (
+        " ".join(q.casefold().split()),
+        (location or "").casefold(),
+        (gl or "").lower(),
+        (hl or "").lower(),
+        int(page),
+        int(num),
+    )
+
+
+class SerpCache:
+    """
+    Дисковий кеш відповідей Serper (SQLite).
+
+    Ключ — sha1 від нормалізованого (q, location, gl, hl, page, num), тож
+    та сама видача в тому ж гео з тією ж глибиною береться з кешу, поки
+    не мине TTL. Розмір обмежено max_mb: при переповненні видаляються
+    записи, до яких найдовше не зверталися (LRU).
+
+    Час доступу при влучанні не пишеться одразу (це був би commit на
+    кожне влучання в циклі подій), а накопичується і скидається разом
+    з наступним put, кожні CACHE_TOUCH_BATCH влучань і при close().
+    """
+
+    def __init__(self, path: str = CACHE_FILE, max_mb: float = CACHE_MAX_MB):
+        self.path = path
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.hits = 0
+        self.misses = 0
+        self._touched = {}         # key -> час доступу, ще не записаний у базу
+        self.conn = sqlite3.connect(path, timeout=30)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS serp_cache ("
+            " key TEXT PRIMARY KEY,"
+            " created REAL NOT NULL,"
+            " accessed REAL NOT NULL,"
+            " size INTEGER NOT NULL,"
+            " data TEXT NOT NULL)"
+        )
+        self.conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_serp_cache_accessed ON serp_cache(accessed)"
+        )
+        self.conn.commit()
+        self.total_bytes = self.conn.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM serp_cache"
+        ).fetchone()[0]
+
+    @staticmethod
+    def make_key(q: str, location: str, gl: str, hl: str, page: int, num: int) -> str:
+        raw = json.dumps(list(normalize_request(q, location, gl, hl, page, num)), ensure_ascii=False)
+        return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+    def get(self, key: str, ttl: float):
+        """Повертає збережену відповідь, якщо вона молодша за ttl секунд, інакше None."""
+        row = self.conn.execute(
+            "SELECT created, data FROM serp_cache WHERE key = ?", (key,)
+        ).fetchone()
+        now = time.time()
+        if row is None or now - row[0] > ttl:
+            self.misses += 1
+            return None
+        self._touched[key] = now
+        if len(self._touched) >= CACHE_TOUCH_BATCH:
+            self._flush_touched()
+            self.conn.commit()
+        self.hits += 1
+        return json.loads(row[1])
+
+    def put(self, key: str, data: dict):
+        raw = json.dumps(data, ensure_ascii=False)
+        now = time.time()
+        self._touched.pop(key, None)
+        # LRU-порядок для витіснення — з урахуванням ще не записаних влучань
+        self._flush_touched()
+        old = self.conn.execute("SELECT size FROM serp_cache WHERE key = ?", (key,)).fetchone()
+        self.conn.execute(
+            "INSERT OR REPLACE INTO serp_cache (key, created, accessed, size, data) "
+            "VALUES (?, ?, ?, ?, ?)",
+            (key, now, now, len(raw), raw),
+        )
+        self.total_bytes += len(raw) - (old[0] if old else 0)
+        if self.total_bytes > self.max_bytes:
+            self._evict()
+        self.conn.commit()
+
+    def _flush_touched(self):
+        if self._touched:
+            self.conn.executemany(
+                "UPDATE serp_cache SET accessed = ? WHERE key = ?",
+                [(accessed, key) for key, accessed in self._touched.items()],
+            )
+            self._touched.clear()
+
+    def _evict(self):
+        # витісняємо до 90% стелі, щоб не чистити на кожному put
+        target = int(self.max_bytes * 0.9)
+        rows = self.conn.execute(
+            "SELECT key, size FROM serp_cache ORDER BY accessed ASC"
+        )
+        to_delete = []
+        for key, size in rows:
+            if self.total_bytes <= target:
+                break
+            to_delete.append((key,))
+            self.total_bytes -= size
+        self.conn.executemany("DELETE FROM serp_cache WHERE key = ?", to_delete)
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 3) if total else 0.0,
+            "size_mb": round(self.total_bytes / 1024 / 1024, 2),
+        }
+
+    def close(self):
+        try:
+            self._flush_touched()
+            self.conn.commit()
+        except Exception as e:
+            print(f"Не вдалося записати час доступу кешу: {e}")
+        try:
+            self.conn.close()
+        except Exception:
+            pass
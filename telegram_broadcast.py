@@ -0,0 +1,127 @@
+import asyncio
+import logging
+from collections import defaultdict
+from pathlib import Path
+
+from telegram.error import BadRequest, Forbidden, NetworkError, RetryAfter
+
+logger = logging.getLogger(__name__)
+
+# =========================
+# Налаштування розсилки
+# =========================
+TG_MESSAGES_PER_SECOND = 25.0      # загальний темп бота (ліміт Telegram — ~30/с)
+TG_CHAT_INTERVAL = 1.0             # сек між повідомленнями в один чат
+TG_MAX_RETRIES = 3                 # повтори після RetryAfter / мережевої помилки
+
+
+class Broadcaster:
+    """
+    Розсилка підписникам: усі чати паралельно, але не швидше
+    TG_MESSAGES_PER_SECOND на бота і TG_CHAT_INTERVAL на чат.
+    На RetryAfter (flood wait) чекаємо, скільки сказав Telegram, і
+    повторюємо; Forbidden / BadRequest не повторюються.
+
+    Документ завантажується один раз — решта чатів отримує його за
+    file_id з першої відповіді, без повторного відправлення байтів.
+    Один екземпляр на бота, щоб темп був спільним для всіх розсилок.
+    """
+
+    def __init__(
+        self,
+        bot,
+        messages_per_second: float = TG_MESSAGES_PER_SECOND,
+        chat_interval: float = TG_CHAT_INTERVAL,
+        max_retries: int = TG_MAX_RETRIES,
+    ):
+        self.bot = bot
+        self.interval = 1.0 / messages_per_second if messages_per_second > 0 else 0.0
+        self.chat_interval = chat_interval
+        self.max_retries = max_retries
+        self.next_slot = 0.0
+        self.lock = asyncio.Lock()
+        self.chat_locks = defaultdict(asyncio.Lock)
+        self.chat_next = {}
+
+    async def _global_slot(self):
+        async with self.lock:
+            now = asyncio.get_running_loop().time()
+            slot = max(now, self.next_slot)
+            self.next_slot = slot + self.interval
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+    async def _call(self, chat_id: int, method, **kwargs):
+        """Один виклик API для чату з обома лімітами і повторами; None — не вдалося."""
+        loop = asyncio.get_running_loop()
+        # лок чату тримається і на час повторів — порядок повідомлень у чаті зберігається
+        async with self.chat_locks[chat_id]:
+            for attempt in range(self.max_retries + 1):
+                wait = self.chat_next.get(chat_id, 0.0) - loop.time()
+                if wait > 0:
+                    await asyncio.sleep(wait)
+                await self._global_slot()
+                try:
+                    return await method(chat_id=chat_id, **kwargs)
+                except RetryAfter as e:
+                    delay = e.retry_after
+                    delay = delay.total_seconds() if hasattr(delay, "total_seconds") else float(delay)
+                    logger.warning("flood wait %.0fs for %s", delay, chat_id)
+                    # flood wait стосується всього бота — зсуваємо і загальний слот
+                    async with self.lock:
+                        self.next_slot = max(self.next_slot, loop.time() + delay)
+                except (Forbidden, BadRequest) as e:
+                    logger.warning("%s failed for %s: %s", method.__name__, chat_id, e)
+                    return None
+                except NetworkError as e:
+                    delay = 2 ** attempt
+                    logger.warning("%s network error for %s: %s", method.__name__, chat_id, e)
+                except Exception as e:
+                    logger.warning("%s failed for %s: %s", method.__name__, chat_id, e)
+                    return None
+                finally:
+                    self.chat_next[chat_id] = loop.time() + self.chat_interval
+                if attempt < self.max_retries:
+                    await asyncio.sleep(delay)
+        logger.warning("%s gave up for %s", method.__name__, chat_id)
+        return None
+
+    async def send_message(self, chat_id: int, text: str) -> bool:
+        sent = await self._call(chat_id, self.bot.send_message, text=text, parse_mode="Markdown")
+        return sent is not None
+
+    async def broadcast_message(self, chat_ids, text: str) -> int:
+        """Надсилає text усім chat_ids; повертає кількість доставлених."""
+        results = await asyncio.gather(*(self.send_message(uid, text) for uid in chat_ids))
+        return sum(results)
+
+    async def broadcast_document(self, chat_ids, path: Path, caption: str) -> int:
+        """
+        Завантажує файл першому чату, що його прийняв, решті — за file_id
+        паралельно. Повертає кількість доставлених.
+        """
+        chat_ids = list(chat_ids)
+        # байти, а не відкритий файл: повтор після RetryAfter / мережевої помилки
+        # має відправити файл заново, а не дочитаний до кінця дескриптор
+        data = Path(path).read_bytes()
+        filename = Path(path).name
+        file_id = None
+        delivered = 0
+        while chat_ids and file_id is None:
+            uid = chat_ids.pop(0)
+            msg = await self._call(uid, self.bot.send_document, document=data, filename=filename, caption=caption)
+            if msg is not None:
+                delivered += 1
+                file_id = msg.document.file_id if msg.document else None
+                if file_id is None:
+                    break
+        if file_id is None:
+            # file_id не повернувся — кожному окремо (рідкісний випадок)
+            for uid in chat_ids:
+                if await self._call(uid, self.bot.send_document, document=data, filename=filename, caption=caption):
+                    delivered += 1
+            return delivered
+        results = await asyncio.gather(
+            *(self._call(uid, self.bot.send_document, document=file_id, caption=caption) for uid in chat_ids)
+        )
+        return delivered + sum(1 for r in results if r is not None)